@@ -2,14 +2,20 @@ import streamlit as st
 import pandas as pd
 from pathlib import Path
 import json
+import hashlib
+import os
+import uuid
 import matplotlib.pyplot as plt
 import io
+import time
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import A4
 from datetime import datetime
 from auth_csv import login, register
-from ocr_pipeline import process_upload
+from ocr_jobs import submit_ocr_job, get_job, get_job_result
 from bank_matching import rank_banks_for_user
+from bank_catalog import recommended_banks, takeover_banks, find_bank, get_bank, calculator_defaults
+from recommendations import for_user as recommendations_for_user
 from apply import append_application, list_user_applications
 from emi import calculate_emi
 #from flask import Flask, render_template
@@ -161,10 +167,20 @@ def sidebar_navigation():
 
 
 def save_uploaded_file(uploaded_file):
+    """
+    Store an upload under a path unique to its content (uploads/<hash>_<name>)
+    and return it. A file already stored there has the same bytes and is left
+    alone, so a background OCR job reading it never sees it being rewritten.
+    """
     Path("uploads").mkdir(exist_ok=True)
-    dest = Path("uploads") / uploaded_file.name
-    with open(dest, "wb") as f:
-        f.write(uploaded_file.getbuffer())
+    data = uploaded_file.getbuffer()
+    digest = hashlib.sha256(data).hexdigest()[:16]
+    dest = Path("uploads") / f"{digest}_{Path(uploaded_file.name).name}"
+    if not dest.exists():
+        tmp = dest.with_name(f"{dest.name}.{uuid.uuid4().hex}.tmp")
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, dest)
     return str(dest)
 
 
@@ -257,8 +273,6 @@ def upload_page():
 
     uploaded_file = st.file_uploader("📤 Upload PDF", type=["pdf"])
     if uploaded_file:
-        file_path = save_uploaded_file(uploaded_file)
-
         # File info card
         st.markdown(f"""
             <div style='background-color:#ffffff;
@@ -273,7 +287,29 @@ def upload_page():
         """, unsafe_allow_html=True)
 
         try:
-            extracted = process_upload(user_email, [file_path])
+            # Streamlit reruns this page on every widget interaction while the
+            # uploader holds a file; only submit (and record) each upload once.
+            upload_key = f"{user_email}:{uploaded_file.name}:{uploaded_file.size}"
+            if st.session_state.get("processed_upload_key") != upload_key:
+                # written once per upload, not on every poll rerun
+                file_path = save_uploaded_file(uploaded_file)
+                st.session_state["ocr_job_id"] = submit_ocr_job(user_email, [file_path])
+                st.session_state["processed_upload_key"] = upload_key
+
+            # OCR runs in the background job queue; poll until it finishes
+            job = get_job(st.session_state["ocr_job_id"])
+            if job is None or job["status"] == "failed":
+                raise RuntimeError(job["error"] if job else "OCR job was lost")
+            if job["status"] != "done":
+                total = job.get("pages_total") or 0
+                done = job.get("pages_done") or 0
+                label = "⏳ Waiting in queue..." if job["status"] == "queued" else f"🔍 Extracting text — page {done} of {total or '?'}"
+                st.progress(done / total if total else 0.0, text=label)
+                time.sleep(1)
+                safe_rerun()
+                return
+
+            extracted = get_job_result(job["job_id"]) or {}
             st.success(f"✅ Uploaded successfully: {uploaded_file.name}")
 
             # Default placeholders for missing values
@@ -391,121 +427,20 @@ def recommendations_page():
     st.markdown("### 🤖 AI Loan Recommendations")
     st.write("Based on your profile, here are your best loan matches:")
 
-    banks = [
-        {
-            "name": "State Bank of India (SBI)",
-            "details": """
-SBI integrates the PM-Vidyalaxmi scheme with its flagship Student Loan Scheme, automatically connecting eligible students to the Central Sector Interest Subsidy (CSIS) and Credit Guarantee Fund Scheme for Education Loans (CGFSEL).
-
-Students from weaker sections can access **Padho Pardesh** (for overseas studies) and **Dr. Ambedkar Central Sector Scheme** (for OBC/EWS students), which are seamlessly verified via the Vidya Lakshmi Portal.
-
-**Interest Rate:** Around 8.15%–10.50% p.a., with 0.50% concession for female students and top institutions.
-""",
-            "approval": "98%"
-        },
-        {
-            "name": "Punjab National Bank (PNB)",
-            "details": """
-PNB’s **PNB Saraswati** and **PNB Pratibha** Education Loan schemes are directly linked to the PM-Vidyalaxmi and CSIS frameworks. The bank prioritizes economically weaker sections through real-time subsidy mapping and online application status tracking.
-
-PNB also participates in **Dr. Ambedkar Scheme** for meritorious OBC students and **Padho Pardesh** for minority communities.
-
-**Interest Rate:** 8.75%–10.25% p.a., with additional rebates under government schemes.
-""",
-            "approval": "96%"
-        },
-        {
-            "name": "Bank of Baroda (BoB)",
-            "details": """
-BoB offers the **Baroda Gyan** and **Baroda Scholar** education loans via the PM-Vidyalaxmi portal, ensuring automatic integration with CSIS and CGFSEL.
-
-It also provides the **Skill Loan Scheme** for vocational courses under the Government of India’s Skill India Mission.
-
-**Interest Rate:** 8.55%–10.65% p.a., with concessions for girl students and premium institutions.
-""",
-            "approval": "94%"
-        },
-        {
-            "name": "Canara Bank",
-            "details": """
-Canara Bank’s **Vidya Turant** and Education Loan Scheme are synchronized with PM-Vidyalaxmi, ensuring automatic verification for CSIS and CGFSEL benefits.
-
-It also participates in **Dr. Ambedkar Interest Subsidy Scheme** and **Padho Pardesh** for minority and backward community students.
-
-**Interest Rate:** 8.60%–10.40% p.a., with 0.40% concession for female candidates.
-""",
-            "approval": "92%"
-        },
-        {
-            "name": "Union Bank of India",
-            "details": """
-Union Bank links PM-Vidyalaxmi and CSIS directly to its **Education Loan Scheme for Higher Studies**. The bank has digitized the moratorium interest subsidy claim process, reducing paperwork for students.
-
-It also includes **Vocational and Skill Development Loans** under the **NSDC Skill India Scheme** for short-term technical programs.
-
-**Interest Rate:** 8.70%–10.50% p.a., with interest-free moratorium for eligible applicants.
-""",
-            "approval": "90%"
-        },
-        {
-            "name": "HDFC Bank",
-            "details": """
-Though a private sector bank, HDFC aligns selected education loans with PM-Vidyalaxmi and **National Scholarship Portal** for subsidy validation.
-
-It also collaborates with **MahaDBT (Maharashtra)** and **Karnataka Udyogini Yojana** to support local students.
-
-**Interest Rate:** 9.25%–11.50% p.a., depending on institution ranking and applicant profile.
-""",
-            "approval": "88%"
-        },
-        {
-            "name": "ICICI Bank",
-            "details": """
-ICICI integrates the PM-Vidyalaxmi subsidy options with its **Education Loan for Higher Studies**, supported by an AI-based approval scoring system.
-
-Apart from central subsidies, ICICI supports the **Dr. Ambedkar Scheme** and **National Minorities Development Loan Schemes** for select applicants.
-
-**Interest Rate:** 9.00%–11.25% p.a., with dynamic concession for strong academic profiles.
-""",
-            "approval": "87%"
-        },
-        {
-            "name": "Axis Bank",
-            "details": """
-Axis Bank’s **Education Loan Advantage Scheme** incorporates PM-Vidyalaxmi and CSIS-based subsidies for Indian and overseas studies.
-
-It also offers **Women Empowerment Education Concessions** under the **Stand Up India** initiative, making it unique among private players.
-
-**Interest Rate:** 8.90%–11.00% p.a., with up to 0.75% discount for top 100 institutes.
-""",
-            "approval": "86%"
-        },
-        {
-            "name": "IDBI Bank",
-            "details": """
-IDBI includes PM-Vidyalaxmi, CSIS, and CGFSEL under its **Education Loan for India** product. The bank also implements the **Skill Loan Scheme** for vocational training under Skill India and **Dr. Ambedkar Scheme** for OBC/Minority groups.
-
-Loans up to ₹7.5 lakh are collateral-free under the guarantee fund, and interest subsidy is auto-credited post verification.
-
-**Interest Rate:** 8.85%–10.75% p.a., with female and merit-based concessions.
-""",
-            "approval": "84%"
-        },
-        {
-            "name": "Indian Bank",
-            "details": """
-Indian Bank’s **IB Education Loan Scheme** fully integrates with PM-Vidyalaxmi, providing Aadhaar-linked verification for CSIS and **Padho Pardesh** eligibility.
-
-It also offers **Skill India Loans** for technical or paramedical courses, especially targeting rural students through CSC (Common Service Centre) partnerships.
-
-**Interest Rate:** 8.65%–10.60% p.a., with rebates for girl students and those from EWS backgrounds.
-""",
-            "approval": "82%"
-        },
-    ]
+    # ranked from the user's precomputed scores; the full scheme list until documents are uploaded
+    ranked = recommendations_for_user(st.session_state.get("user_email", ""))
+    if ranked:
+        banks = [{**(get_bank(r["bank_id"]) or {"bank_id": r["bank_id"], "display_name": r["bank_name"]}),
+                  "score": r["score"], "why": r["why"]} for r in ranked]
+    else:
+        st.info("Upload your documents to see these banks ranked by your GPA and income.")
+        banks = recommended_banks()
 
     # --- Display bank recommendations ---
     for i, bank in enumerate(banks, start=1):
+        details = bank.get('details') or bank.get('notes') or ""
+        approval = f"✅ Approval Rate: {bank['approval']}" if bank.get('approval') else ""
+        match = f"<b>Match Score:</b> {bank['score']} / 100 — <i>{bank['why']}</i>" if 'score' in bank else ""
         st.markdown(f"""
         <div style="
             background-color:#f8faff;
@@ -514,44 +449,22 @@ It also offers **Skill India Loans** for technical or paramedical courses, espec
             margin-bottom:20px;
             box-shadow:0 2px 6px rgba(0,0,0,0.08);
         ">
-            <h4 style="color:#2b4c7e; margin-bottom:10px;">🏦 {i}. {bank['name']}</h4>
-            <p style="font-size:15px; line-height:1.7; color:#333;">{bank['details']}</p>
-            <p style="font-weight:600; color:#2b9348; margin-top:8px;">✅ Approval Rate: {bank['approval']}</p>
+            <h4 style="color:#2b4c7e; margin-bottom:10px;">🏦 {i}. {bank['display_name']}</h4>
+            <p style="font-size:15px; line-height:1.7; color:#333;">{details}</p>
+            <p style="font-size:15px; color:#333;">{match}</p>
+            <p style="font-weight:600; color:#2b9348; margin-top:8px;">{approval}</p>
         </div>
         """, unsafe_allow_html=True)
         # Streamlit button for each bank: go to Calculator with defaults
         apply_key = f"reco_apply_{i}"
         if st.button("Apply for Loan", key=apply_key):
-            # Bank-specific defaults: max loan amount and fixed interest rate
-            name = bank.get('name', '')
-            # reasonable defaults; customize per bank where needed
-            bank_defaults = {
-                'State Bank of India': {'loan_min': 0, 'loan_max': 500000, 'rate': 8.15},
-                'Punjab National Bank': {'loan_min': 0, 'loan_max': 450000, 'rate': 8.75},
-                'Bank of Baroda': {'loan_min': 0, 'loan_max': 400000, 'rate': 8.55},
-                'Canara Bank': {'loan_min': 0, 'loan_max': 400000, 'rate': 8.60},
-                'Union Bank of India': {'loan_min': 0, 'loan_max': 400000, 'rate': 8.70},
-                'HDFC Bank': {'loan_min': 0, 'loan_max': 350000, 'rate': 9.25},
-                'ICICI Bank': {'loan_min': 0, 'loan_max': 350000, 'rate': 9.00},
-                'Axis Bank': {'loan_min': 0, 'loan_max': 350000, 'rate': 8.90},
-                'IDBI Bank': {'loan_min': 0, 'loan_max': 375000, 'rate': 8.85},
-                'Indian Bank': {'loan_min': 0, 'loan_max': 300000, 'rate': 8.65},
-            }
-
-            # choose a match by substring to be resilient to parentheses in names
-            chosen = None
-            for k, v in bank_defaults.items():
-                if k in name:
-                    chosen = v
-                    break
-
-            if chosen is None:
-                chosen = {'loan_min': 50000, 'loan_max': 350000, 'rate': 10.5}
+            # Bank-specific defaults (max loan amount, fixed interest rate) from the catalog
+            chosen = calculator_defaults(bank)
 
             # prefill the calculator with bank-specific constraints and a fixed rate
             st.session_state['calc_prefill'] = {
-                'bank_id': i,
-                'bank_name': bank.get('name'),
+                'bank_id': bank.get('bank_id'),
+                'bank_name': bank.get('display_name'),
                 'loan_amount': chosen['loan_max'],
                 'loan_min': chosen.get('loan_min', 0),
                 'loan_max': chosen.get('loan_max', 350000),
@@ -791,18 +704,18 @@ def schedule_appointment_page():
 def my_loans_page():
     st.header("📅 My Loan Applications")
 
-    # Dummy loan data for now (replace later with CSV or database)
-    apps = [
-        {"app_id": 1, "status": "Pending"},
-        {"app_id": 2, "status": "Approved", "bank_name": "State Bank of India"}
-    ]
+    # latest state per application, straight from the application_state view
+    apps = list_user_applications(st.session_state.get("user_email", ""))
+    if not apps:
+        st.info("You have no loan applications yet.")
+        return
 
     st.success(f"Found {len(apps)} loan application(s).")
 
     for app in apps:
         with st.expander(f"📄 Application ID: {app['app_id']} | Status: {app['status']}"):
 
-            if app["status"].lower() == "approved":
+            if str(app.get("status") or "").lower() == "approved":
                 st.subheader("📈 Loan Payment Progress (Line Graph)")
 
                 # Example payment history data
@@ -864,21 +777,13 @@ def my_loans_page():
                 elif st.session_state["takeover_step"] == 1:
                     st.info("Step 1 of 2 – Choose the bank you’d like to take over your loan.")
 
-                    # Example bank list and rates (replace with data/banks.csv if available)
-                    all_banks = [
-                        {"id": "SBI", "name": "State Bank of India", "rate": 8.15},
-                        {"id": "PNB", "name": "Punjab National Bank", "rate": 8.75},
-                        {"id": "BoB", "name": "Bank of Baroda", "rate": 8.55},
-                        {"id": "Canara", "name": "Canara Bank", "rate": 8.60},
-                        {"id": "HDFC", "name": "HDFC Bank", "rate": 9.25},
-                        {"id": "ICICI", "name": "ICICI Bank", "rate": 9.00},
-                        {"id": "Axis", "name": "Axis Bank", "rate": 8.90},
-                        {"id": "IDBI", "name": "IDBI Bank", "rate": 8.85},
-                        {"id": "Indian", "name": "Indian Bank", "rate": 8.65},
-                    ]
-
-                    current_bank = app.get("bank_name") or app.get("bank_id") or ""
-                    available_banks = [b for b in all_banks if b["name"] != current_bank and b["id"] != current_bank]
+                    all_banks = [{"id": b["takeover_code"], "name": b["name"], "rate": b["rate"]}
+                                 for b in takeover_banks()]
+
+                    # the current bank may be stored by display name, csv name or id
+                    current = find_bank(app.get("bank_name")) or get_bank(app.get("bank_id"))
+                    current_code = current.get("takeover_code") if current else None
+                    available_banks = [b for b in all_banks if b["id"] != current_code]
 
                     choice = st.selectbox(
                         "Select takeover bank",
@@ -973,7 +878,7 @@ def my_loans_page():
                     col1, col2 = st.columns(2)
                     with col1:
                         if st.button("✅ Confirm Takeover"):
-                            import csv, os
+                            from apply import append_takeover
                             from datetime import datetime
                             takeover_row = {
                                 "user_email": st.session_state.get("user_email", "unknown"),
@@ -986,14 +891,7 @@ def my_loans_page():
                                 "status": "requested"
                             }
 
-                            os.makedirs("data", exist_ok=True)
-                            path = "data/takeovers.csv"
-                            write_header = not os.path.exists(path)
-                            with open(path, "a", newline="", encoding="utf-8") as f:
-                                writer = csv.DictWriter(f, fieldnames=list(takeover_row.keys()))
-                                if write_header:
-                                    writer.writeheader()
-                                writer.writerow(takeover_row)
+                            append_takeover(takeover_row)
 
                             st.success("🎉 Takeover request submitted! A bank officer will contact you shortly.")
                             st.session_state["takeover_step"] = 0
@@ -0,0 +1,220 @@
+# application_state.py
+"""
+Application status events and the "current state" view built from them.
+
+Status changes are recorded as events (the application_events table) instead
+of extra application rows, and every application plus every event is folded
+into a view keyed by app_id that always holds the latest state. Readers
+(My Loans, list_user_applications, reporting) read the view and never have
+to group or deduplicate the underlying tables.
+
+* sqlite backend: the view is the application_state table, written in the
+  same transaction as the application or event it reflects.
+* csv backend: the view is kept in memory and advanced by reading only the
+  journal bytes appended since the last refresh. A checkpoint (view plus
+  journal offsets) is saved every VIEW_CHECKPOINT_EVERY changes so a new
+  process does not replay the whole history.
+
+Legacy duplicate application rows (the same app_id written again with a new
+status) are folded the same way: the later row wins.
+"""
+import json
+import os
+import threading
+from pathlib import Path
+
+import pandas as pd
+
+import journal
+import storage
+from utils import now_iso
+
+VIEW_COLUMNS = storage.SCHEMAS["application_state"]
+VIEW_CHECKPOINT = journal.JOURNAL_DIR / "application_state.json"
+VIEW_CHECKPOINT_EVERY = int(os.environ.get("FINBRIDGE_VIEW_CHECKPOINT_EVERY", 500))
+
+
+def _view_row(app):
+    """The view entry for an applications row, with the form's bank and loan fields lifted out."""
+    row = {c: app.get(c) for c in journal.TABLES["applications"]}
+    if not row["user_email"] and app.get("user_id") is not None:
+        row["user_email"] = str(app["user_id"])  # older data keyed by user_id
+    try:
+        form = json.loads(app.get("filled_form_fields_json") or "{}")
+    except (TypeError, ValueError):
+        form = {}
+    row["bank_name"] = form.get("bank_name")
+    row["loan_amount"] = form.get("loan_amount")
+    row["tenure_years"] = form.get("tenure_years")
+    row["updated_at"] = app.get("timestamp")
+    return row
+
+
+def _app_id(rec):
+    try:
+        return int(rec.get("app_id"))
+    except (TypeError, ValueError):
+        return None
+
+
+# -----------------------------------------------------
+# csv backend: in-memory view over the journals
+# -----------------------------------------------------
+class _JournalView:
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.state = None       # app_id -> view row
+        self.by_user = {}       # user_email -> app_ids
+        self.offsets = {}
+        self.pending = 0        # changes since the last checkpoint
+
+    def _load_checkpoint(self):
+        try:
+            with open(VIEW_CHECKPOINT, encoding="utf-8") as f:
+                data = json.load(f)
+            self.state = {int(k): v for k, v in data["state"].items()}
+            self.offsets = data["offsets"]
+        except (OSError, ValueError, KeyError):
+            self.state, self.offsets = {}, {}
+        self.by_user = {}
+        for app_id, row in self.state.items():
+            self.by_user.setdefault(row.get("user_email"), set()).add(app_id)
+
+    def _save_checkpoint(self):
+        tmp = Path(str(VIEW_CHECKPOINT) + f".{os.getpid()}.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"offsets": self.offsets, "state": self.state}, f, ensure_ascii=False, default=str)
+        tmp.replace(VIEW_CHECKPOINT)
+        self.pending = 0
+
+    def refresh(self):
+        with self.lock:
+            if self.state is None:
+                self._load_checkpoint()
+            # Events are read before applications: every event read refers to an
+            # application written before it, so that application is in this batch
+            # or an earlier one.
+            events, ev_end = journal.read_since("application_events", self.offsets.get("application_events", 0))
+            apps, app_end = journal.read_since("applications", self.offsets.get("applications", 0))
+            for app in apps:
+                app_id = _app_id(app)
+                if app_id is not None:
+                    old = self.state.get(app_id)
+                    if old is not None:
+                        self.by_user.get(old.get("user_email"), set()).discard(app_id)
+                    row = self.state[app_id] = _view_row(app)
+                    self.by_user.setdefault(row.get("user_email"), set()).add(app_id)
+            for ev in events:
+                cur = self.state.get(_app_id(ev))
+                if cur is not None:
+                    cur["status"] = ev.get("status")
+                    cur["updated_at"] = ev.get("changed_at")
+            self.offsets = {"applications": app_end, "application_events": ev_end}
+            self.pending += len(apps) + len(events)
+            if self.pending >= VIEW_CHECKPOINT_EVERY:
+                self._save_checkpoint()
+
+    def get(self, app_id):
+        with self.lock:
+            self.refresh()
+            row = self.state.get(int(app_id))
+            return dict(row) if row else None
+
+    def rows(self, user_email=None):
+        with self.lock:
+            self.refresh()
+            if user_email is None:
+                return [dict(r) for r in self.state.values()]
+            return [dict(self.state[i]) for i in self.by_user.get(user_email, ())]
+
+
+_view = _JournalView()
+
+
+# -----------------------------------------------------
+# sqlite backend
+# -----------------------------------------------------
+_sqlite_ready = False
+
+
+def _store():
+    """The SQLite store, with the view table rebuilt once if it predates this module."""
+    global _sqlite_ready
+    store = storage.get_store()
+    if not _sqlite_ready:
+        if store.count("application_state") == 0 and store.count("applications") > 0:
+            rebuild_view()
+        _sqlite_ready = True
+    return store
+
+
+def rebuild_view():
+    """Recompute the whole view from applications + events (sqlite backend)."""
+    store = storage.get_store()
+    state = {}
+    for app in store.read_table("applications").to_dict("records"):
+        app = {k: (None if isinstance(v, float) and pd.isna(v) else v) for k, v in app.items()}
+        if _app_id(app) is not None:
+            state[_app_id(app)] = _view_row(app)
+    for ev in store.read_table("application_events").to_dict("records"):
+        cur = state.get(_app_id(ev))
+        if cur is not None:
+            cur.update(status=ev["status"], updated_at=ev["changed_at"])
+    with store.transaction():
+        for row in state.values():
+            store.upsert("application_state", "app_id", row)
+    return len(state)
+
+
+# -----------------------------------------------------
+# Public API
+# -----------------------------------------------------
+def add_application(row):
+    """Store a new applications row and add it to the view."""
+    if storage.use_sqlite():
+        store = _store()
+        with store.transaction():
+            store.insert("applications", row)
+            store.upsert("application_state", "app_id", _view_row(row))
+        return row
+    storage.append_record("applications", row)
+    _view.refresh()
+    return row
+
+
+def set_status(app_id, status, note=None):
+    """Record a status change for app_id and apply it to the view; returns the event."""
+    event = {"app_id": int(app_id), "status": status, "changed_at": now_iso(), "note": note}
+    if storage.use_sqlite():
+        store = _store()
+        with store.transaction():
+            store.insert("application_events", event)
+            store.update("application_state", "app_id", int(app_id),
+                         {"status": status, "updated_at": event["changed_at"]})
+        return event
+    storage.append_record("application_events", event)
+    _view.refresh()
+    return event
+
+
+def get_application(app_id):
+    """Current state of one application, or None."""
+    if storage.use_sqlite():
+        rows = _store().find("application_state", "app_id", int(app_id))
+        return rows[0] if rows else None
+    return _view.get(app_id)
+
+
+def applications_for_user(user_email):
+    """Current state of every application of user_email, oldest first."""
+    if storage.use_sqlite():
+        return _store().find("application_state", "user_email", user_email)
+    return sorted(_view.rows(user_email), key=lambda r: r["app_id"])
+
+
+def current_view():
+    """The whole view as a DataFrame, one row per application (for reporting)."""
+    if storage.use_sqlite():
+        return _store().read_table("application_state")
+    rows = sorted(_view.rows(), key=lambda r: r["app_id"])
+    return pd.DataFrame(rows, columns=VIEW_COLUMNS)
@@ -6,6 +6,10 @@ import json
 from pathlib import Path
 from datetime import datetime, timedelta
 
+import application_state
+import storage
+from utils import next_id, read_table_csv
+
 # -------------------------
 # Paths
 # -------------------------
@@ -16,14 +20,14 @@ APPOINTMENTS_CSV = DATA_DIR / "appointments.csv"
 # -------------------------
 # Utility: Safe CSV Read
 # -------------------------
-def safe_read_csv(path, columns):
-    """Safely read or create CSV with given columns."""
+def safe_read_csv(path, columns, table=None):
+    """Safely read or create CSV with given columns (typed via the utils schema when table is given)."""
     if not os.path.exists(path) or os.path.getsize(path) == 0:
         df = pd.DataFrame(columns=columns)
         df.to_csv(path, index=False)
         return df
     try:
-        df = pd.read_csv(path)
+        df = read_table_csv(path, table) if table else pd.read_csv(path)
         if df.empty:
             df = pd.DataFrame(columns=columns)
         return df
@@ -37,21 +41,10 @@ def safe_read_csv(path, columns):
 # -------------------------
 def append_application(user_email, bank_id, filled_fields):
     """
-    Add new loan application to applications.csv and return app_id.
+    Add new loan application to the configured storage and return app_id.
     Supports both old (user_id as int) and new (user_email as str) data.
     """
-    cols = ["app_id", "user_email", "bank_id", "status", "filled_form_fields_json", "timestamp"]
-    df = safe_read_csv(APPLICATIONS_CSV, cols)
-
-    # determine next id
-    if len(df) == 0:
-        app_id = 1
-    else:
-        try:
-            app_id = int(df['app_id'].max()) + 1
-        except Exception:
-            app_id = len(df) + 1
-
+    app_id = next_id("applications", seed=lambda: storage.max_id("applications", "app_id"))
     new_row = {
         "app_id": app_id,
         "user_email": str(user_email),
@@ -61,49 +54,35 @@ def append_application(user_email, bank_id, filled_fields):
         "timestamp": datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
     }
 
-    df = pd.concat([df, pd.DataFrame([new_row])], ignore_index=True)
-    df.to_csv(APPLICATIONS_CSV, index=False)
+    application_state.add_application(new_row)
     return app_id
 
 # -------------------------
 # List Applications for User
 # -------------------------
 def list_user_applications(user_email):
-    """Return all loan applications for the given user email."""
-    if not APPLICATIONS_CSV.exists():
-        return pd.DataFrame()
-
-    df = pd.read_csv(APPLICATIONS_CSV)
+    """
+    Return the loan applications of the given user email, one record per
+    application in its latest state (read from the application_state view).
+    """
+    return application_state.applications_for_user(user_email)
 
-    if "user_email" in df.columns:
-        user_apps = df[df["user_email"] == user_email]
-    elif "user_id" in df.columns:
-        # fallback for older data formats
-        user_apps = df[df["user_id"].astype(str) == str(user_email)]
-    else:
-        user_apps = pd.DataFrame()
 
-    return user_apps.to_dict("records")
+def update_application_status(app_id, status, note=None):
+    """Record a status change (e.g. 'approved') for an application."""
+    return application_state.set_status(app_id, status, note)
 
 # -------------------------
 # Schedule Appointment
 # -------------------------
+def _next_appointment_id():
+    return next_id("appointments", seed=lambda: storage.max_id("appointments", "appointment_id"))
+
 def schedule_appointment(user_email, app_id, bank_id, days_from_now=3):
     """Create a simple appointment record scheduled days_from_now in the future."""
-    cols = ["appointment_id", "app_id", "user_email", "bank_id", "scheduled_time", "created_at", "status"]
-    df = safe_read_csv(APPOINTMENTS_CSV, cols)
-
-    if len(df) == 0:
-        appointment_id = 1
-    else:
-        try:
-            appointment_id = int(df['appointment_id'].max()) + 1
-        except Exception:
-            appointment_id = len(df) + 1
-
     scheduled = (datetime.utcnow() + timedelta(days=days_from_now)).strftime("%Y-%m-%d %H:%M:%S")
     new_row = {
-        "appointment_id": appointment_id,
+        "appointment_id": _next_appointment_id(),
         "app_id": int(app_id),
         "user_email": str(user_email),
         "bank_id": int(bank_id),
@@ -112,24 +91,12 @@ def schedule_appointment(user_email, app_id, bank_id, days_from_now=3):
         "status": "Scheduled"
     }
 
-    df = pd.concat([df, pd.DataFrame([new_row])], ignore_index=True)
-    df.to_csv(APPOINTMENTS_CSV, index=False)
-    return appointment_id, scheduled
+    storage.append_record("appointments", new_row)
+    return new_row["appointment_id"], scheduled
 
 
 def schedule_appointment_custom(user_email, app_id, bank_id, scheduled_time_str):
     """Schedule an appointment at a specific datetime string (ISO or '%Y-%m-%d %H:%M')."""
-    cols = ["appointment_id", "app_id", "user_email", "bank_id", "scheduled_time", "created_at", "status"]
-    df = safe_read_csv(APPOINTMENTS_CSV, cols)
-
-    if len(df) == 0:
-        appointment_id = 1
-    else:
-        try:
-            appointment_id = int(df['appointment_id'].max()) + 1
-        except Exception:
-            appointment_id = len(df) + 1
-
     # Normalize scheduled time string
     try:
         # Accept either ISO or common format
@@ -142,7 +109,7 @@ def schedule_appointment_custom(user_email, app_id, bank_id, scheduled_time_str)
             scheduled = scheduled_time_str
 
     new_row = {
-        "appointment_id": appointment_id,
+        "appointment_id": _next_appointment_id(),
         "app_id": int(app_id),
         "user_email": str(user_email),
         "bank_id": int(bank_id),
@@ -151,6 +118,21 @@ def schedule_appointment_custom(user_email, app_id, bank_id, scheduled_time_str)
         "status": "Scheduled"
     }
 
-    df = pd.concat([df, pd.DataFrame([new_row])], ignore_index=True)
-    df.to_csv(APPOINTMENTS_CSV, index=False)
-    return appointment_id, scheduled
+    storage.append_record("appointments", new_row)
+    return new_row["appointment_id"], scheduled
+
+def list_user_appointments(user_email):
+    """Return the appointments of the given user email, oldest first."""
+    return storage.user_records("appointments", user_email)
+
+# -------------------------
+# Loan Takeover Request
+# -------------------------
+def append_takeover(takeover_row):
+    """Record a loan takeover request and return the stored row."""
+    return storage.append_record("takeovers", takeover_row)
+
+
+def list_user_takeovers(user_email):
+    """Return the takeover requests of the given user email, oldest first."""
+    return storage.user_records("takeovers", user_email)
@@ -1,10 +1,14 @@
 # auth_csv.py
 import pandas as pd
 from pathlib import Path
-from utils import ensure_dirs, now_iso, atomic_save_csv
+from utils import ensure_dirs, now_iso, atomic_save_csv, next_id, read_table_csv, table_lock
 import hashlib
 import os
 import base64
+import sqlite3
+import threading
+import storage
+import auth_pool
 
 # Prefer passlib when available; if not, provide a minimal compatible
 # pbkdf2_sha256 replacement so the app can run without the dependency.
@@ -61,44 +65,182 @@ except Exception:
 ensure_dirs()
 USERS_CSV = Path("data") / "users.csv"
 
-def _load_users():
-    if USERS_CSV.exists():
-        return pd.read_csv(USERS_CSV)
-    return pd.DataFrame(columns=["id","email","password_hash","full_name","phone","created_at","profile_completed"])
+USER_COLUMNS = ["id","email","password_hash","full_name","phone","created_at","profile_completed"]
+
+def _load_users(columns=None):
+    return read_table_csv(USERS_CSV, "users", columns)
+
+
+class UserIndex:
+    """
+    Process-wide lookup of users.csv by email and by id.
+
+    The file is parsed once and re-parsed only when its (inode, mtime, size)
+    signature changes, i.e. when another process rewrote it. Writes made
+    through this module update the dicts in place and re-sign, so they do
+    not force a rebuild.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.lock = threading.RLock()
+        self._sig = None
+        self.by_email = {}
+        self.by_id = {}
+        self.max_id = 0
+        self.rebuilds = 0
+
+    def _signature(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def _add(self, rec):
+        # the first row wins, as with the old users[mask].iloc[0] lookups
+        email = rec.get("email")
+        if isinstance(email, str):
+            self.by_email.setdefault(email, rec)
+        uid = rec.get("id")
+        if uid is not None and not pd.isna(uid):
+            self.by_id.setdefault(int(uid), rec)
+            self.max_id = max(self.max_id, int(uid))
+
+    def refresh(self):
+        with self.lock:
+            sig = self._signature()
+            if sig == self._sig and sig is not None:
+                return
+            self.by_email, self.by_id, self.max_id = {}, {}, 0
+            users = read_table_csv(self.path, "users")
+            for rec in users.to_dict("records"):
+                self._add(rec)
+            self._sig = sig
+            self.rebuilds += 1
+
+    def get(self, field, value):
+        """A copy of the user whose email or id equals value, or None."""
+        with self.lock:
+            self.refresh()
+            rec = self.by_email.get(value) if field == "email" else self.by_id.get(int(value))
+            return dict(rec) if rec is not None else None
+
+    def wrote(self, rec=None):
+        """
+        Record a write this process just made: index rec and adopt the file's
+        new signature. The caller holds table_lock("users") across its write
+        and this call, so the signature can't take in another process's row.
+        """
+        with self.lock:
+            if rec is not None:
+                self._add(rec)
+            self._sig = self._signature()
+
+
+_users = UserIndex(USERS_CSV)
+
+
+def _append_user(row):
+    """Append one row to users.csv; the file is rewritten only if its header lacks a column."""
+    with table_lock("users"):
+        header = []
+        if USERS_CSV.exists() and os.path.getsize(USERS_CSV) > 0:
+            header = list(pd.read_csv(USERS_CSV, nrows=0).columns)
+        if not header or not set(row).issubset(header):
+            users = pd.concat([_load_users(), pd.DataFrame([row])], ignore_index=True)
+            atomic_save_csv(users, USERS_CSV)
+        else:
+            pd.DataFrame([row]).reindex(columns=header).to_csv(USERS_CSV, mode="a", header=False, index=False)
 
 def register(email, password, full_name="", phone=""):
-    users = _load_users()
-    if (users['email'] == email).any():
+    if storage.use_sqlite():
+        return _register_sqlite(email, password, full_name, phone)
+    if _users.get("email", email) is not None:
         return False, "Email already registered"
-    new_id = int(users['id'].max()) + 1 if len(users) > 0 else 1
-    pw_hash = pbkdf2_sha256.hash(password)
-    row = {"id": new_id, "email": email, "password_hash": pw_hash, "full_name": full_name, "phone": phone, "created_at": now_iso(), "profile_completed": False}
-    users = pd.concat([users, pd.DataFrame([row])], ignore_index=True)
+    # hashed before taking the index lock, so logins and other registrations don't wait on it
+    try:
+        pw_hash = auth_pool.hash_password(pbkdf2_sha256, password)
+    except auth_pool.PoolBusy as e:
+        return False, str(e)
+    # check, append and re-sign in one table_lock section: a row another process
+    # appends meanwhile is then either seen by the check or changes the signature
+    with _users.lock, table_lock("users"):
+        _users.refresh()
+        if _users.get("email", email) is not None:
+            # another session or process registered the same email while we hashed
+            return False, "Email already registered"
+        new_id = next_id("users", seed=lambda: _users.max_id)
+        row = {"id": new_id, "email": email, "password_hash": pw_hash, "full_name": full_name, "phone": phone, "created_at": now_iso(), "profile_completed": False}
+        _append_user(row)
+        _users.wrote(row)
+    return True, "Registered"
 
-    atomic_save_csv(users, USERS_CSV)
+def _register_sqlite(email, password, full_name, phone):
+    store = storage.get_store()
+    if store.find("users", "email", email):
+        return False, "Email already registered"
+    try:
+        pw_hash = auth_pool.hash_password(pbkdf2_sha256, password)
+    except auth_pool.PoolBusy as e:
+        return False, str(e)
+    new_id = next_id("users", seed=lambda: store.max_value("users", "id"))
+    row = {"id": new_id, "email": email, "password_hash": pw_hash, "full_name": full_name, "phone": phone, "created_at": now_iso(), "profile_completed": False}
+    try:
+        store.insert("users", row)
+    except sqlite3.IntegrityError:
+        # another session registered the same email since the lookup
+        return False, "Email already registered"
     return True, "Registered"
 
+def _find_user(field, value):
+    """First user whose field (email or id) equals value, as a dict, or None."""
+    if storage.use_sqlite():
+        rows = storage.get_store().find("users", field, value)
+        return rows[0] if rows else None
+    return _users.get(field, value)
+
 def login(email, password):
-    users = _load_users()
-    match = users[users['email'] == email]
-    if match.empty:
+    wait = auth_pool.throttle_remaining(email)
+    if wait:
+        return False, f"Too many failed attempts. Try again in {int(wait) + 1} seconds"
+    user = _find_user("email", email)
+    if user is None:
         return False, "Email not found"
-    pw_hash = match.iloc[0]['password_hash']
-    if pbkdf2_sha256.verify(password, pw_hash):
-        return True, dict(match.iloc[0])
+    pw_hash = user['password_hash']
+    try:
+        ok = auth_pool.verify_password(pbkdf2_sha256, password, pw_hash)
+    except auth_pool.PoolBusy as e:
+        return False, str(e)
+    auth_pool.record_attempt(email, ok)
+    if ok:
+        return True, user
     return False, "Wrong password"
 
 def get_user_by_id(uid):
-    users = _load_users()
-    match = users[users['id'] == int(uid)]
-    return dict(match.iloc[0]) if not match.empty else None
+    return _find_user("id", int(uid))
 
 def update_user_profile(uid, updates:dict):
-    users = _load_users()
-    idx = users[users['id'] == int(uid)].index
-    if len(idx) == 0:
-        return False
-    for k, v in updates.items():
-        users.at[idx[0], k] = v
-    atomic_save_csv(users, USERS_CSV)
+    if storage.use_sqlite():
+        return storage.get_store().update("users", "id", int(uid), updates) > 0
+    def apply_updates(users):
+        idx = users[users['id'] == int(uid)].index
+        if len(idx) == 0:
+            return None
+        for k, v in updates.items():
+            if k in users.columns:
+                users[k] = users[k].astype(object)  # typed columns reject values of another type
+            users.at[idx[0], k] = v
+        return users
+
+    with _users.lock, table_lock("users"):
+        _users.refresh()
+        users = apply_updates(read_table_csv(USERS_CSV, "users"))
+        if users is None:
+            return False
+        atomic_save_csv(users, USERS_CSV)
+        rec = _users.by_id.get(int(uid))
+        if rec is not None:
+            rec.update(updates)
+        _users.wrote()
     return True
@@ -0,0 +1,143 @@
+# auth_pool.py
+"""
+Bounded worker pool for password hashing and verification.
+
+PBKDF2 (29000 rounds) used to run on the Streamlit script thread, so a burst
+of logins or registrations could occupy every core and stall the other
+sessions' reruns. Hash and verify now run on a small thread pool (hashlib's
+PBKDF2 releases the GIL, so the pool size bounds the cores used). Callers
+still wait for their own result, but:
+
+* at most AUTH_POOL_QUEUE_LIMIT requests may be queued or running; beyond
+  that PoolBusy is raised straight away instead of piling up work;
+* an email with AUTH_THROTTLE_MAX_FAILURES wrong passwords inside
+  AUTH_THROTTLE_WINDOW seconds is refused without running PBKDF2 at all
+  until the oldest failure ages out.
+
+auth_pool_stats() reports queue wait and run time per operation.
+"""
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+AUTH_POOL_WORKERS = int(os.environ.get("AUTH_POOL_WORKERS", max(1, (os.cpu_count() or 2) // 2)))
+AUTH_POOL_QUEUE_LIMIT = int(os.environ.get("AUTH_POOL_QUEUE_LIMIT", 32))
+AUTH_THROTTLE_MAX_FAILURES = int(os.environ.get("AUTH_THROTTLE_MAX_FAILURES", 5))
+AUTH_THROTTLE_WINDOW = float(os.environ.get("AUTH_THROTTLE_WINDOW", 300))
+
+
+class PoolBusy(RuntimeError):
+    """The hash pool already has AUTH_POOL_QUEUE_LIMIT requests outstanding."""
+
+
+_executor = ThreadPoolExecutor(max_workers=AUTH_POOL_WORKERS, thread_name_prefix="auth-hash")
+_slots = threading.BoundedSemaphore(AUTH_POOL_QUEUE_LIMIT)
+_lock = threading.Lock()
+_failures = {}      # email -> deque of failure times (monotonic)
+_stats = {
+    op: {"count": 0, "wait_s": 0.0, "max_wait_s": 0.0, "run_s": 0.0, "max_run_s": 0.0}
+    for op in ("hash", "verify")
+}
+_counters = {"busy": 0, "throttled": 0}
+
+
+# -----------------------------------------------------
+# Pool
+# -----------------------------------------------------
+def _submit(op, fn, *args):
+    if not _slots.acquire(blocking=False):
+        with _lock:
+            _counters["busy"] += 1
+        raise PoolBusy("Too many sign-ins in progress, please try again in a moment")
+    queued = time.perf_counter()
+
+    def task():
+        started = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            done = time.perf_counter()
+            with _lock:
+                s = _stats[op]
+                s["count"] += 1
+                s["wait_s"] += started - queued
+                s["max_wait_s"] = max(s["max_wait_s"], started - queued)
+                s["run_s"] += done - started
+                s["max_run_s"] = max(s["max_run_s"], done - started)
+
+    try:
+        future = _executor.submit(task)
+    except BaseException:
+        _slots.release()
+        raise
+    future.add_done_callback(lambda _: _slots.release())
+    return future.result()
+
+
+def hash_password(hasher, password):
+    """hasher.hash(password) on the pool. Raises PoolBusy when the queue is full."""
+    return _submit("hash", hasher.hash, password)
+
+
+def verify_password(hasher, password, stored):
+    """hasher.verify(password, stored) on the pool. Raises PoolBusy when the queue is full."""
+    return _submit("verify", hasher.verify, password, stored)
+
+
+# -----------------------------------------------------
+# Per-email throttling
+# -----------------------------------------------------
+def _recent_failures(email, now):
+    # caller holds _lock
+    q = _failures.get(email)
+    if q is None:
+        return None
+    while q and now - q[0] > AUTH_THROTTLE_WINDOW:
+        q.popleft()
+    if not q:
+        del _failures[email]
+        return None
+    return q
+
+
+def throttle_remaining(email):
+    """Seconds until email may try again, or 0 if it is not throttled."""
+    now = time.monotonic()
+    with _lock:
+        q = _recent_failures(email, now)
+        if q is None or len(q) < AUTH_THROTTLE_MAX_FAILURES:
+            return 0
+        _counters["throttled"] += 1
+        return AUTH_THROTTLE_WINDOW - (now - q[0])
+
+
+def record_attempt(email, ok):
+    """Count a wrong password against email; a successful login clears its history."""
+    now = time.monotonic()
+    with _lock:
+        if ok:
+            _failures.pop(email, None)
+            return
+        q = _recent_failures(email, now)
+        if q is None:
+            q = _failures[email] = deque(maxlen=AUTH_THROTTLE_MAX_FAILURES)
+        q.append(now)
+
+
+def auth_pool_stats():
+    """Queue wait / run time per operation, plus rejected and throttled counts."""
+    with _lock:
+        out = {"workers": AUTH_POOL_WORKERS, "queue_limit": AUTH_POOL_QUEUE_LIMIT,
+               "tracked_emails": len(_failures), **_counters}
+        for op, s in _stats.items():
+            n = s["count"] or 1
+            out[op] = {
+                "count": s["count"],
+                "avg_wait_ms": round(s["wait_s"] / n * 1000, 3),
+                "max_wait_ms": round(s["max_wait_s"] * 1000, 3),
+                "avg_run_ms": round(s["run_s"] / n * 1000, 3),
+                "max_run_ms": round(s["max_run_s"] * 1000, 3),
+            }
+        return out
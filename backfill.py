@@ -0,0 +1,185 @@
+# backfill.py
+"""
+Bulk OCR backfill for folders of uploaded documents.
+
+    python backfill.py DROP_DIR --manifest manifest.csv [--workers N] [--batch-size 200]
+
+The manifest is a CSV with `path,email` columns. `path` is relative to
+DROP_DIR and names either a file or a sub-folder; a file takes the email of
+the longest matching entry. Files already in documents.csv (matched by
+content hash) are skipped, so an interrupted run can simply be restarted.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path, PurePosixPath
+
+import pandas as pd
+
+import storage
+from ocr_pipeline import (
+    DOCS_CSV, IMAGE_SUFFIXES, allocate_doc_ids, append_docs, build_doc_row, file_sha256, ocr_file,
+)
+from utils import read_table_csv
+
+SUPPORTED_SUFFIXES = (".pdf",) + IMAGE_SUFFIXES
+
+
+# -----------------------------------------------------
+# Inputs
+# -----------------------------------------------------
+def load_manifest(path):
+    """Return {relative path prefix: email}, with paths normalised to '/' separators."""
+    df = pd.read_csv(path, dtype=str)
+    missing = {"path", "email"} - set(df.columns)
+    if missing:
+        raise ValueError(f"Manifest {path} is missing column(s): {', '.join(sorted(missing))}")
+    df = df.dropna(subset=["path", "email"])
+    return {
+        str(PurePosixPath(p.replace("\\", "/").strip().strip("/"))): e.strip()
+        for p, e in zip(df["path"], df["email"])
+    }
+
+
+def email_for(rel_path, manifest, default_email=None):
+    """Email of the longest manifest prefix covering rel_path (a PurePosixPath)."""
+    for candidate in [rel_path, *rel_path.parents]:
+        email = manifest.get(str(candidate))
+        if email:
+            return email
+    return default_email
+
+
+def iter_documents(root):
+    for dirpath, _, filenames in os.walk(root):
+        for name in sorted(filenames):
+            if name.lower().endswith(SUPPORTED_SUFFIXES):
+                yield Path(dirpath) / name
+
+
+def processed_hashes():
+    """Content hashes of every file already recorded in the documents table."""
+    if storage.use_sqlite():
+        values = storage.get_store().values("documents", "source_hashes")
+    elif not DOCS_CSV.exists() or os.path.getsize(DOCS_CSV) == 0:
+        return set()
+    elif "source_hashes" not in pd.read_csv(DOCS_CSV, nrows=0).columns:
+        return set()
+    else:
+        values = read_table_csv(DOCS_CSV, "documents", ["source_hashes"])["source_hashes"].dropna()
+    seen = set()
+    for val in values:
+        try:
+            seen.update(json.loads(val))
+        except ValueError:
+            continue
+    return seen
+
+
+# -----------------------------------------------------
+# Worker
+# -----------------------------------------------------
+def _ocr_one(path, digest):
+    """Process-pool task: OCR one file serially (the pool already uses every core)."""
+    t0 = time.perf_counter()
+    text, fields, pages = ocr_file(path, workers=1, digest=digest)
+    return fields, pages, time.perf_counter() - t0
+
+
+# -----------------------------------------------------
+# Driver
+# -----------------------------------------------------
+def backfill(root, manifest, default_email=None, workers=None, batch_size=200, log=print):
+    root = Path(root)
+    workers = workers or os.cpu_count() or 1
+    seen = processed_hashes()
+
+    jobs = []
+    skipped = unmapped = 0
+    for path in iter_documents(root):
+        rel = PurePosixPath(path.relative_to(root).as_posix())
+        email = email_for(rel, manifest, default_email)
+        if not email:
+            unmapped += 1
+            log(f"skip (no manifest entry): {rel}")
+            continue
+        digest = file_sha256(path)
+        if digest in seen:
+            skipped += 1
+            continue
+        seen.add(digest)  # also dedupes identical files within this drop
+        jobs.append((path, email, digest))
+
+    log(f"{len(jobs)} file(s) to process, {skipped} already processed, {unmapped} unmapped")
+    if not jobs:
+        return {"files": 0, "pages": 0, "failed": 0, "skipped": skipped, "unmapped": unmapped, "seconds": 0.0}
+
+    # doc_ids are reserved a batch at a time: one sequence lock per batch, not per row
+    ids = iter(())
+    batch = []
+    users = set()
+    files = pages = failed = 0
+    t0 = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(_ocr_one, str(path), digest): (path, email, digest) for path, email, digest in jobs}
+        for fut in as_completed(futures):
+            path, email, digest = futures[fut]
+            try:
+                fields, page_info, _ = fut.result()
+            except Exception as e:
+                failed += 1
+                log(f"FAILED {path}: {e}")
+                continue
+            page_sources = [{"file": str(path), **pg} for pg in page_info]
+            doc_id = next(ids, None)
+            if doc_id is None:
+                ids = iter(allocate_doc_ids(min(batch_size, len(jobs) - files - failed)))
+                doc_id = next(ids)
+            batch.append(build_doc_row(doc_id, email, [str(path)], fields, page_sources, [digest]))
+            files += 1
+            pages += len(page_info)
+            if len(batch) >= batch_size:
+                append_docs(batch, recommend=False)
+                users.update(row["email"] for row in batch)
+                batch = []
+                elapsed = time.perf_counter() - t0
+                log(f"{files}/{len(jobs)} files, {pages} pages, {pages / elapsed:.2f} pages/sec")
+    append_docs(batch, recommend=False)
+    users.update(row["email"] for row in batch)
+    if users:
+        # one pass over the documents table for the whole run, not one per batch
+        import recommendations  # imports bank_matching / streamlit; only needed once rows exist
+        recommendations.rebuild_users(users)
+        log(f"recommendations rebuilt for {len(users)} user(s)")
+
+    elapsed = time.perf_counter() - t0
+    return {"files": files, "pages": pages, "failed": failed, "skipped": skipped,
+            "unmapped": unmapped, "seconds": elapsed}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="OCR a folder of documents into documents.csv.")
+    parser.add_argument("directory", help="folder to walk for PDFs and images")
+    parser.add_argument("--manifest", help="CSV with path,email columns mapping files or folders to users")
+    parser.add_argument("--default-email", help="email for files the manifest does not cover")
+    parser.add_argument("--workers", type=int, default=None, help="OCR processes (default: all cores)")
+    parser.add_argument("--batch-size", type=int, default=200, help="documents per append to documents.csv")
+    args = parser.parse_args(argv)
+
+    if not args.manifest and not args.default_email:
+        parser.error("give --manifest, --default-email, or both")
+    manifest = load_manifest(args.manifest) if args.manifest else {}
+
+    stats = backfill(args.directory, manifest, args.default_email, args.workers, args.batch_size)
+    rate = stats["pages"] / stats["seconds"] if stats["seconds"] else 0.0
+    print(f"Done: {stats['files']} files, {stats['pages']} pages in {stats['seconds']:.1f}s "
+          f"({rate:.2f} pages/sec); {stats['failed']} failed, {stats['skipped']} already processed, "
+          f"{stats['unmapped']} unmapped")
+    return 1 if stats["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,203 @@
+# bank_catalog.py
+"""
+Process-wide bank catalog: data/banks.csv (eligibility criteria) joined with
+data/bank_profiles.json (display name, scheme details, calculator defaults,
+takeover code).
+
+Both files are parsed once and re-parsed only when either one's (inode,
+mtime, size) signature changes, so a Streamlit rerun costs two stat() calls.
+Entries are indexed by bank_id and by normalized name, so the csv short
+name ("SBI"), the full name ("State Bank of India"), the display name
+("State Bank of India (SBI)") and the takeover code all resolve to the same
+bank in one dict lookup.
+
+A profile whose bank_name matches no banks.csv row is still listed (it has
+no bank_id and no eligibility criteria, so it is never scored).
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+from pathlib import Path
+
+import pandas as pd
+
+from utils import read_table_csv
+
+BANKS_CSV = Path("data") / "banks.csv"
+PROFILES_JSON = Path("data") / "bank_profiles.json"
+
+# used for a bank without a profile, as the calculator did before
+DEFAULT_CALCULATOR = {"loan_min": 50000, "loan_max": 350000, "rate": 10.5}
+
+
+def normalize_name(name):
+    """Lower-case alphanumeric words of a bank name: 'Bank of Baroda (BoB)' -> 'bank of baroda bob'."""
+    return " ".join(re.findall(r"[a-z0-9]+", str(name).lower()))
+
+
+class BankCatalog:
+    def __init__(self, banks_csv=BANKS_CSV, profiles_json=PROFILES_JSON):
+        self.paths = (Path(banks_csv), Path(profiles_json))
+        self.lock = threading.RLock()
+        self._sig = None
+        self.frame = None       # banks.csv as a typed DataFrame
+        self.entries = []       # catalog order: profiles first, then csv-only banks
+        self.by_id = {}
+        self.by_name = {}
+        self.bank_versions = {}  # bank_id -> hash of its banks.csv row
+        self.reloads = 0
+
+    def _signature(self):
+        sig = []
+        for path in self.paths:
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                sig.append(None)
+                continue
+            sig.append((st.st_ino, st.st_mtime_ns, st.st_size))
+        return tuple(sig)
+
+    def _load_profiles(self):
+        try:
+            with open(self.paths[1], encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return []
+
+    def _index(self, entry):
+        if entry.get("bank_id") is not None:
+            self.by_id.setdefault(entry["bank_id"], entry)
+        for key in (entry.get("bank_name"), entry.get("name"), entry.get("display_name"),
+                    entry.get("takeover_code"), *entry.get("aliases", ())):
+            if key:
+                self.by_name.setdefault(normalize_name(key), entry)
+
+    def refresh(self):
+        with self.lock:
+            sig = self._signature()
+            if sig == self._sig:
+                return
+            frame = read_table_csv(self.paths[0], "banks")
+            rows = {}
+            versions = {}
+            for rec in frame.to_dict("records"):
+                rec = {k: (None if v is None or v is pd.NA or (isinstance(v, float) and pd.isna(v)) else v) for k, v in rec.items()}
+                rows.setdefault(normalize_name(rec["bank_name"]), rec)
+                if rec.get("bank_id") is not None:
+                    blob = json.dumps(rec, sort_keys=True, default=str).encode("utf-8")
+                    versions[rec["bank_id"]] = hashlib.sha1(blob).hexdigest()[:16]
+            entries = []
+            for profile in self._load_profiles():
+                row = rows.pop(normalize_name(profile.get("bank_name") or profile["name"]), {})
+                entries.append({**row, **profile, "bank_name": row.get("bank_name", profile.get("bank_name"))})
+            for row in rows.values():
+                entries.append({**row, "name": row["bank_name"]})
+            for e in entries:
+                e.setdefault("bank_id", None)
+                e.setdefault("display_name", e["name"])
+            self.frame, self.entries, self.bank_versions = frame, entries, versions
+            self.by_id, self.by_name = {}, {}
+            for e in entries:
+                self._index(e)
+            self._sig = sig
+            self.reloads += 1
+
+    def get(self, bank_id):
+        with self.lock:
+            self.refresh()
+            try:
+                entry = self.by_id.get(int(bank_id))
+            except (TypeError, ValueError):
+                return None
+            return dict(entry) if entry else None
+
+    def find(self, name):
+        with self.lock:
+            self.refresh()
+            entry = self.by_name.get(normalize_name(name))
+            return dict(entry) if entry else None
+
+    def select(self, field):
+        """Entries that have `field` set, in catalog order."""
+        with self.lock:
+            self.refresh()
+            return [dict(e) for e in self.entries if e.get(field) is not None]
+
+    def versions(self):
+        """{bank_id: version}; a bank's version changes whenever its banks.csv row does."""
+        with self.lock:
+            self.refresh()
+            return dict(self.bank_versions)
+
+    def banks_frame(self, columns=None):
+        with self.lock:
+            self.refresh()
+            frame = self.frame if columns is None else self.frame.reindex(columns=list(columns))
+            return frame.copy()
+
+
+_catalog = BankCatalog()
+
+
+def get_bank(bank_id):
+    """Catalog entry of bank_id, or None."""
+    return _catalog.get(bank_id)
+
+
+def find_bank(name):
+    """Catalog entry whose csv name, full name, display name, takeover code or alias is `name`, or None."""
+    if name is None:
+        return None
+    return _catalog.find(name)
+
+
+def banks_frame(columns=None):
+    """banks.csv as a typed DataFrame (a copy; only `columns` when given)."""
+    return _catalog.banks_frame(columns)
+
+
+def bank_versions():
+    """{bank_id: content hash of its banks.csv row}, for caches of per-bank results."""
+    return _catalog.versions()
+
+
+def banks_with_versions():
+    """(banks_frame(), bank_versions()) taken from the same load of banks.csv."""
+    with _catalog.lock:
+        _catalog.refresh()
+        return _catalog.frame.copy(), dict(_catalog.bank_versions)
+
+
+def catalog_version():
+    """Signature of the files behind the catalog; changes whenever banks.csv or bank_profiles.json does."""
+    with _catalog.lock:
+        _catalog.refresh()
+        return _catalog._sig
+
+
+def catalog_snapshot():
+    """(banks_frame(), catalog_version(), bank_versions()) taken from the same load of banks.csv."""
+    with _catalog.lock:
+        _catalog.refresh()
+        return _catalog.frame.copy(), _catalog._sig, dict(_catalog.bank_versions)
+
+
+def recommended_banks():
+    """Banks with a scheme description, in the order the Recommendations page lists them."""
+    return _catalog.select("details")
+
+
+def takeover_banks():
+    """Banks that accept loan takeovers: entries with a takeover_code."""
+    return _catalog.select("takeover_code")
+
+
+def calculator_defaults(bank):
+    """{'loan_min', 'loan_max', 'rate'} the loan calculator uses for a catalog entry (or None)."""
+    out = dict(DEFAULT_CALCULATOR)
+    if bank:
+        out.update({k: bank[k] for k in DEFAULT_CALCULATOR if bank.get(k) is not None})
+    return out
@@ -1,12 +1,13 @@
 # bank_matching.py
+import numpy as np
 import pandas as pd
 import streamlit as st
-from pathlib import Path
+from bank_catalog import banks_frame
+from bank_rules import CompiledRules, compiled_catalog
 
-BANKS_CSV = Path("data") / "banks.csv"
-
-def load_banks():
-    return pd.read_csv(BANKS_CSV)
+def load_banks(columns=None):
+    """banks.csv as a typed DataFrame, from the cached catalog (re-read only when the file changes)."""
+    return banks_frame(columns)
 
 def compute_approval(user_profile, bank_row):
     score = 0
@@ -59,30 +60,82 @@ def compute_approval(user_profile, bank_row):
     return final_score, why
 
 
-def rank_banks_for_user(user_profile):
-    banks = load_banks().to_dict(orient='records')
+# -----------------------------------------------------
+# Vectorized scoring
+# -----------------------------------------------------
+# The criteria compute_approval() hard-codes are declared in bank_rules and
+# compiled once per catalog; the default rules give the same scores and text.
+# Every function takes the CompiledRules of `banks` as `rules` so callers
+# scoring the same frame repeatedly compile it once.
+
+def score_banks(user_profile, banks, rules=None):
+    """
+    Scores of one profile against every row of banks at once, as a
+    bank_rules.Evaluation: .score is an int array aligned with banks and
+    .explain(i) the `why` text of row i.
+    """
+    return (rules or CompiledRules(banks)).evaluate(user_profile)
+
+
+def score_matrix(values, banks, rules=None):
+    """
+    Scores of many users against every bank, as a users x banks int8 array
+    built by broadcasting. values maps profile fields (extracted_gpa,
+    extracted_income, ...) to per-user float arrays, NaN where the value is
+    missing or unparsable.
+    """
+    return (rules or CompiledRules(banks)).evaluate_matrix(values)
+
+
+def rank_banks_for_user(user_profile, top_k=None, banks=None, rules=None):
+    """
+    Banks ordered by score (ties keep catalog order), scored as whole
+    columns; result dicts and explanations are built only for the top_k
+    returned (all when None). Without banks, the catalog's compiled rules
+    are reused across calls.
+    """
+    if banks is None:
+        banks, rules = compiled_catalog()
+    elif rules is None:
+        rules = CompiledRules(banks)
+    result = rules.evaluate(user_profile)
+    score = result.score
+    order = np.argsort(-score, kind="stable")[:top_k]
+    # only the returned rows of only the shown columns are turned into Python objects
+    column = lambda name, default: (banks[name].to_numpy()[order] if name in banks.columns
+                                    else [default] * len(order))
+    rows = zip(order, column('bank_id', None), column('bank_name', None), column('base_interest_rate', 0),
+               column('max_loan_amount', 500000), column('approval_rate', 90),
+               column('description', "This bank offers education loans under PM-Vidyalaxmi and CSIS schemes."))
     results = []
-
-    for b in banks:
-        score, why = compute_approval(user_profile, b)
+    for i, bank_id, name, interest, max_amount, approval, description in rows:
         results.append({
-            'bank_id': int(b['bank_id']),
-            'bank_name': b['bank_name'],
-            'score': score,
-            'why': why,
-            'interest': float(b.get('base_interest_rate', 0)),
-            'max_amount': int(b.get('max_loan_amount', 500000)),
-            'approval': int(b.get('approval_rate', 90)),
-            'description': b.get('description', "This bank offers education loans under PM-Vidyalaxmi and CSIS schemes.")
+            'bank_id': int(bank_id),
+            'bank_name': name,
+            'score': int(score[i]),
+            'why': result.explain(i),
+            'interest': float(interest),
+            'max_amount': int(max_amount),
+            'approval': int(approval),
+            'description': description
         })
-
-    results = sorted(results, key=lambda x: x['score'], reverse=True)
     return results
 
 
+DISPLAY_PAGE = 10  # banks shown per "Show more"
+
+
+def _show_more_banks():
+    st.session_state["ranked_banks_shown"] += DISPLAY_PAGE
+
+
 def display_ranked_banks(user_profile):
     st.markdown("<h2 style='color:#1E90FF;'>🏦 Recommended Banks for You</h2>", unsafe_allow_html=True)
-    ranked = rank_banks_for_user(user_profile)
+    shown = st.session_state.setdefault("ranked_banks_shown", DISPLAY_PAGE)
+    # one extra row tells whether there is more to show
+    ranked = rank_banks_for_user(user_profile, top_k=shown + 1)
+    more = len(ranked) > shown
+    ranked = ranked[:shown]
 
     for i, bank in enumerate(ranked, start=1):
         with st.container():
@@ -104,6 +157,9 @@ def display_ranked_banks(user_profile):
                 st.session_state["selected_bank"] = bank
                 st.switch_page("pages/loan_calculator.py")
 
+    if more:
+        st.button("Show more banks", key="ranked_banks_more", on_click=_show_more_banks)
+
     # Summary
     st.markdown("""
     <br><h4>🧩 Summary Insight</h4>
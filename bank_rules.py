@@ -0,0 +1,308 @@
+# bank_rules.py
+"""
+Declarative eligibility rules for bank scoring.
+
+Each rule is a dict (DEFAULT_RULES, or data/bank_rules.json when present)
+naming a profile field, a banks.csv column and the points it is worth:
+
+* "min" / "max": profile field >= / <= the bank's column. Earns `points`
+  when met; otherwise adds a reason ("<label> missing", "<label> parse
+  error" or the `fail` text). With "reject": true a failed check rejects
+  the bank outright (score 0) and no further rules are evaluated for it.
+* "constant": `points` for every bank.
+* "band": the bank's column alone decides: `low_points` at or below `low`,
+  `high_points` above `high` (`default` stands in when the column is
+  missing).
+
+A bank may override any rule's points with a "<rule name>_points" column in
+banks.csv. Rules are compiled once per catalog into NumPy arrays. Rules that
+do not depend on the applicant (constant, band) are folded into one
+precomputed vector at compile time, so they cost nothing per ranking; each
+applicant rule is one vectorized comparison over the banks still in the
+running. rule_stats() reports the time spent per rule.
+
+DEFAULT_RULES reproduce compute_approval() exactly; the min_income and
+loan_amount rules are declared but disabled. The rule file is re-read only
+when its (inode, mtime, size) signature changes.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+RULES_JSON = Path("data") / "bank_rules.json"
+GOOD_FIT_SCORE = 75
+GOOD_FIT_TEXT = "Good fit — meets most criteria."
+NO_REASON_TEXT = "Partial fit."
+
+# Outcome of an applicant rule for one bank
+PASS, FAIL, MISSING, ERROR, SKIPPED = 0, 1, 2, 3, 4
+
+DEFAULT_RULES = [
+    {"name": "gpa", "kind": "min", "field": "extracted_gpa", "column": "min_gpa", "points": 40,
+     "label": "GPA", "fail": "GPA {value} below min {limit}"},
+    {"name": "income", "kind": "max", "field": "extracted_income", "column": "max_income", "points": 30,
+     "label": "Income", "fail": "Income {value} > max {limit}"},
+    {"name": "baseline", "kind": "constant", "points": 30},
+    {"name": "interest", "kind": "band", "column": "base_interest_rate", "default": 0,
+     "low": 10.5, "low_points": 5, "high": 12, "high_points": -5},
+    {"name": "min_income", "kind": "min", "field": "extracted_income", "column": "min_income", "points": 0,
+     "label": "Income", "fail": "Income {value} below min {limit}", "enabled": False},
+    {"name": "loan_amount", "kind": "max", "field": "extracted_loan_amount", "column": "max_loan", "points": 0,
+     "label": "Loan amount", "fail": "Loan amount {value} > max {limit}", "reject": True, "enabled": False},
+]
+APPLICANT_KINDS = {"min", "max"}
+STATIC_KINDS = {"constant", "band"}
+
+_stats_lock = threading.Lock()
+_stats = {}
+_rules_lock = threading.Lock()
+_rules = {"sig": object(), "rules": None, "version": None}
+
+
+def _hash(rules):
+    blob = json.dumps(rules, sort_keys=True).encode("utf-8")
+    return hashlib.sha1(blob).hexdigest()[:12]
+
+
+def _active_rules():
+    """(rules, version) of the active set, re-read only when bank_rules.json's signature changes."""
+    try:
+        st = os.stat(RULES_JSON)
+        sig = (st.st_ino, st.st_mtime_ns, st.st_size)
+    except FileNotFoundError:
+        sig = None
+    with _rules_lock:
+        if sig != _rules["sig"]:
+            if sig is None:
+                rules = DEFAULT_RULES
+            else:
+                with open(RULES_JSON, encoding="utf-8") as f:
+                    rules = json.load(f)
+            for rule in rules:
+                if rule.get("kind") not in APPLICANT_KINDS | STATIC_KINDS:
+                    raise ValueError(f"rule {rule.get('name')!r}: unknown kind {rule.get('kind')!r}")
+            rules = [dict(r) for r in rules if r.get("enabled", True)]
+            _rules.update(sig=sig, rules=rules, version=_hash(rules))
+        return _rules["rules"], _rules["version"]
+
+
+def load_rules():
+    """The active rule set: data/bank_rules.json if it exists, else DEFAULT_RULES; disabled rules dropped."""
+    return [dict(r) for r in _active_rules()[0]]
+
+
+def rules_version(rules=None):
+    """Short hash of a rule set (the active one by default), for caches of scores computed with it."""
+    return _active_rules()[1] if rules is None else _hash(rules)
+
+
+def _record(name, seconds, banks):
+    with _stats_lock:
+        s = _stats.setdefault(name, {"calls": 0, "seconds": 0.0, "banks": 0})
+        s["calls"] += 1
+        s["seconds"] += seconds
+        s["banks"] += banks
+
+
+def rule_stats():
+    """Per rule: evaluations, banks evaluated and time spent (compile time included under 'compile')."""
+    with _stats_lock:
+        return {name: {"calls": s["calls"], "banks": s["banks"],
+                       "total_ms": round(s["seconds"] * 1000, 3),
+                       "avg_ms": round(s["seconds"] / (s["calls"] or 1) * 1000, 4)}
+                for name, s in _stats.items()}
+
+
+def _profile_number(profile, field):
+    """(float value or None, outcome for every bank or None) of one applicant field."""
+    raw = profile.get(field)
+    if raw is None or pd.isna(raw):
+        return None, MISSING
+    try:
+        return float(raw), None
+    except (TypeError, ValueError):
+        return None, ERROR
+
+
+def _column(banks, column):
+    """(float array, unparsable mask) of a banks column; a missing column is all unparsable."""
+    if column not in banks.columns:
+        return np.full(len(banks), np.nan), np.ones(len(banks), dtype=bool)
+    values = pd.to_numeric(banks[column], errors="coerce")
+    unparsable = values.isna() & banks[column].notna()  # float() would have raised
+    if banks[column].dtype == object:
+        unparsable |= banks[column].map(lambda v: v is None)
+    elif pd.api.types.is_extension_array_dtype(banks[column]):
+        unparsable |= banks[column].isna()  # float(pd.NA) raises as well
+    return values.to_numpy(dtype=float), unparsable.to_numpy()
+
+
+def _points(banks, rule, key="points"):
+    """Per-bank points of a rule: the rule's value, overridden by a '<name>_<key>' column where set."""
+    default = float(rule.get(key, 0))
+    col = f"{rule['name']}_{key}"
+    if col not in banks.columns:
+        return np.full(len(banks), default)
+    override = pd.to_numeric(banks[col], errors="coerce").to_numpy(dtype=float)
+    return np.where(np.isnan(override), default, override)
+
+
+class CompiledRules:
+    """A rule set compiled against one banks frame (row order kept)."""
+
+    def __init__(self, banks, rules=None):
+        t0 = time.perf_counter()
+        self.rules = load_rules() if rules is None else [r for r in rules if r.get("enabled", True)]
+        self.n = len(banks)
+        self.static = np.zeros(self.n)
+        self.checks = []    # applicant rules in evaluation order: rejecting rules first
+        for order, rule in enumerate(self.rules):
+            if rule["kind"] == "constant":
+                self.static += _points(banks, rule)
+            elif rule["kind"] == "band":
+                if rule["column"] in banks.columns:
+                    values = pd.to_numeric(banks[rule["column"]], errors="coerce").to_numpy(dtype=float)
+                else:
+                    values = np.full(self.n, float(rule.get("default", 0)))
+                with np.errstate(invalid="ignore"):
+                    self.static += np.where(values <= rule["low"], _points(banks, rule, "low_points"),
+                                            np.where(values > rule["high"], _points(banks, rule, "high_points"), 0))
+            else:
+                limits, unparsable = _column(banks, rule["column"])
+                raw = banks[rule["column"]].tolist() if rule["column"] in banks.columns else [None] * self.n
+                self.checks.append({**rule, "order": order, "limits": limits, "unparsable": unparsable,
+                                    "raw": raw, "points_arr": _points(banks, rule)})
+        self.checks.sort(key=lambda c: not c.get("reject", False))  # stable: declared order otherwise
+        self.declared = sorted(range(len(self.checks)), key=lambda k: self.checks[k]["order"])
+        for check in self.checks:
+            label = check.get("label", check["name"])
+            check["texts"] = {MISSING: f"{label} missing", ERROR: f"{label} parse error"}
+            check["fail"] = check.get("fail", "{label} {value} outside limit {limit}").replace("{label}", label)
+        _record("compile", time.perf_counter() - t0, self.n)
+
+    def _compare(self, check, value, idx):
+        limits = check["limits"][idx]
+        with np.errstate(invalid="ignore"):
+            ok = value >= limits if check["kind"] == "min" else value <= limits
+        out = np.where(ok, PASS, FAIL).astype(np.int8)
+        out[check["unparsable"][idx]] = ERROR
+        return out
+
+    def evaluate(self, profile):
+        """Score one applicant profile (dict) against every bank; returns an Evaluation."""
+        score = self.static.copy()
+        outcomes = {}
+        rejected_by = np.full(self.n, -1, dtype=np.int16)
+        alive = np.arange(self.n)
+        for k, check in enumerate(self.checks):
+            t0 = time.perf_counter()
+            codes = np.full(self.n, SKIPPED, dtype=np.int8)
+            value, outcome = _profile_number(profile, check["field"])
+            if outcome is not None:
+                codes[alive] = outcome
+            else:
+                codes[alive] = self._compare(check, value, alive)
+            passed = codes == PASS
+            score += np.where(passed, check["points_arr"], 0)
+            if check.get("reject"):
+                failed = alive[codes[alive] == FAIL]
+                rejected_by[failed] = k
+                alive = alive[codes[alive] != FAIL]  # short-circuit: later rules skip these banks
+            outcomes[k] = codes
+            _record(check["name"], time.perf_counter() - t0, len(codes))
+        score = np.clip(score, 0, 100).astype(int)
+        score[rejected_by >= 0] = 0
+        return Evaluation(self, profile, score, outcomes, rejected_by)
+
+    def evaluate_matrix(self, values):
+        """
+        Scores of many applicants against every bank as a users x banks int8
+        array. values maps each applicant field to a per-user float array
+        (NaN where missing or unparsable).
+        """
+        users = len(next(iter(values.values()))) if values else 0
+        score = np.broadcast_to(self.static, (users, self.n)).astype(np.float64)
+        rejected = np.zeros((users, self.n), dtype=bool)
+        for check in self.checks:
+            t0 = time.perf_counter()
+            field = values.get(check["field"])
+            if field is None:
+                field = np.full(users, np.nan)
+            col = np.asarray(field, dtype=float)[:, None]
+            with np.errstate(invalid="ignore"):
+                ok = col >= check["limits"] if check["kind"] == "min" else col <= check["limits"]
+                failed = ~ok & ~np.isnan(col) & ~check["unparsable"]
+            ok &= ~check["unparsable"]
+            score += np.where(ok & ~rejected, check["points_arr"], 0)
+            if check.get("reject"):
+                rejected |= failed
+            _record(check["name"], time.perf_counter() - t0, users * self.n)
+        score = np.clip(score, 0, 100)
+        score[rejected] = 0
+        return score.astype(np.int8)
+
+
+class Evaluation:
+    """Scores of one profile against a compiled catalog, with the outcomes needed to explain them."""
+
+    def __init__(self, compiled, profile, score, outcomes, rejected_by):
+        self.compiled = compiled
+        self.profile = profile
+        self.score = score
+        self.outcomes = outcomes
+        self.rejected_by = rejected_by
+        self._lists = None  # plain-list copies for per-bank lookups, made on the first explain()
+
+    def _reason(self, k, i):
+        check = self.compiled.checks[k]
+        code = self._lists[0][k][i]
+        if code == FAIL:
+            return check["fail"].format(value=self.profile.get(check["field"]), limit=check["raw"][i])
+        return check["texts"].get(code)
+
+    def explain(self, i):
+        """The `why` text for bank row i (compute_approval()'s wording under the default rules)."""
+        if self._lists is None:
+            self._lists = ([self.outcomes[k].tolist() for k in range(len(self.outcomes))],
+                           self.rejected_by.tolist(), self.score.tolist())
+        rejected_by = self._lists[1][i]
+        if rejected_by >= 0:
+            return f"Rejected: {self._reason(rejected_by, i)}"
+        if self._lists[2][i] >= GOOD_FIT_SCORE:
+            return GOOD_FIT_TEXT
+        reasons = [r for r in (self._reason(k, i) for k in self.compiled.declared) if r]
+        return "; ".join(reasons) if reasons else NO_REASON_TEXT
+
+
+_compiled = {}
+_compiled_lock = threading.Lock()
+
+
+def catalog_rules():
+    """
+    (banks frame, {bank_id: version}, CompiledRules) of the current bank
+    catalog, all from one load of banks.csv. Recompiled only when banks.csv
+    or the rules change, so a call costs a few stat() calls. The frame is
+    shared between callers and must not be modified.
+    """
+    from bank_catalog import catalog_snapshot, catalog_version
+    rules, version = _active_rules()
+    key = (catalog_version(), version)
+    with _compiled_lock:
+        hit = _compiled.get("catalog")
+        if hit is None or hit[0] != key:
+            frame, sig, versions = catalog_snapshot()
+            hit = _compiled["catalog"] = ((sig, version), frame, versions, CompiledRules(frame, rules))
+        return hit[1], hit[2], hit[3]
+
+
+def compiled_catalog():
+    """(banks frame, CompiledRules) of the current bank catalog; see catalog_rules()."""
+    frame, _, compiled = catalog_rules()
+    return frame, compiled
@@ -0,0 +1,96 @@
+# benchmarks/bench_preprocess.py
+"""
+Compare Tesseract time and field hit rate with and without preprocessing.
+
+    python -m benchmarks.bench_preprocess uploads/*.pdf uploads/*.jpg
+
+Run from the repository root. Each page is OCR'd twice, once raw and once
+through ocr_pipeline.preprocess_image(); the report shows Tesseract seconds
+per page, preprocessing cost per step, and how many extracted_* fields the
+regex extractor found in each variant.
+"""
+import argparse
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+
+from PIL import Image
+
+import ocr_pipeline as ocr
+
+KEY_FIELDS = ("extracted_gpa", "extracted_income")
+
+
+def _pages(path):
+    if path.suffix.lower() == ".pdf":
+        for first in range(1, ocr._pdf_page_count(str(path)) + 1):
+            yield from ocr.convert_from_path(str(path), dpi=ocr.OCR_DPI, first_page=first, last_page=first)
+    else:
+        yield Image.open(path)
+
+
+def _tesseract(img):
+    t0 = time.perf_counter()
+    text = ocr.pytesseract.image_to_string(img, lang=ocr.OCR_LANG)
+    return text, time.perf_counter() - t0
+
+
+def _hits(text):
+    fields = ocr.extract_fields_from_text(text)
+    found = {k for k, v in fields.items() if k != "raw_text" and v is not None}
+    return found
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("files", nargs="+", help="sample PDFs or images")
+    args = parser.parse_args(argv)
+    ocr._ensure_ocr()
+
+    totals = {"raw": 0.0, "pre": 0.0}
+    step_totals = defaultdict(float)
+    hits = {"raw": defaultdict(int), "pre": defaultdict(int)}
+    n_docs = n_pages = 0
+
+    for name in args.files:
+        path = Path(name)
+        texts = {"raw": [], "pre": []}
+        for img in _pages(path):
+            n_pages += 1
+            text, secs = _tesseract(img)
+            texts["raw"].append(text)
+            totals["raw"] += secs
+
+            clean, timings = ocr.preprocess_image(img)
+            for step, secs in timings.items():
+                step_totals[step] += secs
+            text, secs = _tesseract(clean)
+            texts["pre"].append(text)
+            totals["pre"] += secs
+            img.close()
+        n_docs += 1
+        for variant in ("raw", "pre"):
+            for field in _hits("\n".join(texts[variant])):
+                hits[variant][field] += 1
+        print(f"{path.name}: done")
+
+    if not n_pages:
+        print("no pages found")
+        return 1
+
+    print(f"\n{n_docs} document(s), {n_pages} page(s)")
+    print(f"{'':24}{'raw':>10}{'preprocessed':>14}")
+    print(f"{'tesseract s/page':24}{totals['raw'] / n_pages:>10.3f}{totals['pre'] / n_pages:>14.3f}")
+    pre_cost = sum(step_totals.values()) / n_pages
+    print(f"{'preprocess s/page':24}{0:>10.3f}{pre_cost:>14.3f}")
+    for step, secs in step_totals.items():
+        print(f"{'  ' + step:24}{'':>10}{secs / n_pages:>14.3f}")
+    print("field hit rate (documents with a value):")
+    for field in sorted(set(hits["raw"]) | set(hits["pre"]) | set(KEY_FIELDS)):
+        print(f"{'  ' + field:24}{hits['raw'][field] / n_docs:>10.0%}{hits['pre'][field] / n_docs:>14.0%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
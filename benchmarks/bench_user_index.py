@@ -0,0 +1,88 @@
+# benchmarks/bench_user_index.py
+"""
+Compare user lookups through auth_csv.UserIndex with the old
+read-users.csv-and-filter path.
+
+    python -m benchmarks.bench_user_index [--users 100000] [--lookups 2000]
+
+Run from the repository root. A synthetic users.csv is written to a temp
+directory (data/ is not touched); the report shows milliseconds per lookup
+by email and by id for both paths, plus the cost of one password
+verification for scale.
+"""
+import argparse
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import pandas as pd
+
+import auth_csv
+
+
+def _write_users(path, n, pw_hash):
+    pd.DataFrame({
+        "id": range(1, n + 1),
+        "email": [f"user{i}@example.com" for i in range(1, n + 1)],
+        "password_hash": pw_hash,
+        "full_name": [f"User {i}" for i in range(1, n + 1)],
+        "phone": "9000000000",
+        "created_at": "2025-01-01T00:00:00",
+        "profile_completed": False,
+    }).to_csv(path, index=False)
+
+
+def _scan(path, field, value):
+    users = pd.read_csv(path)
+    match = users[users[field] == value]
+    return dict(match.iloc[0]) if not match.empty else None
+
+
+def _per_call_ms(fn, args):
+    t0 = time.perf_counter()
+    for a in args:
+        fn(*a)
+    return (time.perf_counter() - t0) / len(args) * 1000
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=100000, help="rows in the synthetic users.csv")
+    parser.add_argument("--lookups", type=int, default=2000, help="indexed lookups to time")
+    parser.add_argument("--scans", type=int, default=20, help="full-file scans to time (they are slow)")
+    args = parser.parse_args(argv)
+
+    pw_hash = auth_csv.pbkdf2_sha256.hash("secret")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "users.csv"
+        _write_users(path, args.users, pw_hash)
+        rng = random.Random(0)
+        ids = [rng.randint(1, args.users) for _ in range(max(args.lookups, args.scans))]
+
+        index = auth_csv.UserIndex(path)
+        t0 = time.perf_counter()
+        index.refresh()
+        build_ms = (time.perf_counter() - t0) * 1000
+
+        rows = []
+        for field, key in (("email", lambda i: f"user{i}@example.com"), ("id", lambda i: i)):
+            scan_ms = _per_call_ms(lambda v: _scan(path, field, v), [(key(i),) for i in ids[:args.scans]])
+            index_ms = _per_call_ms(lambda v: index.get(field, v), [(key(i),) for i in ids[:args.lookups]])
+            rows.append((f"lookup by {field}", scan_ms, index_ms))
+
+        t0 = time.perf_counter()
+        auth_csv.pbkdf2_sha256.verify("secret", pw_hash)
+        verify_ms = (time.perf_counter() - t0) * 1000
+
+    print(f"{args.users} users; index built in {build_ms:.1f} ms (once per file change)")
+    print(f"{'':24}{'scan ms':>12}{'index ms':>12}{'speedup':>10}")
+    for name, scan_ms, index_ms in rows:
+        print(f"{name:24}{scan_ms:>12.3f}{index_ms:>12.4f}{scan_ms / index_ms:>9.0f}x")
+    print(f"{'password verify':24}{verify_ms:>12.3f}{verify_ms:>12.3f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
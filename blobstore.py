@@ -0,0 +1,141 @@
+# blobstore.py
+"""
+Compressed, content-addressed store for large document text.
+
+documents.csv used to carry every page of OCR text (raw_text) plus a
+parsed_json copy inline, so loading the table meant parsing megabytes of
+text just to read a few ids. Text now lives under data/blobs/ as
+zlib-compressed files named by the SHA-256 of their content, and the table
+keeps only the hash (raw_text_blob / parsed_json_blob). Identical text is
+stored once; text is read back only when something asks for it.
+
+Rows written before the split keep their inline text and still load; move
+it out with:
+
+    python blobstore.py [--chunksize 5000]
+"""
+import argparse
+import hashlib
+import os
+import sys
+import tempfile
+import zlib
+from functools import lru_cache
+from pathlib import Path
+
+import pandas as pd
+
+from utils import match_file_mode
+
+BLOB_DIR = Path("data") / "blobs"
+COMPRESS_LEVEL = 6
+
+
+def _blob_path(key):
+    return BLOB_DIR / key[:2] / f"{key}.z"
+
+
+def put_text(text):
+    """Store text (if not already stored) and return its key."""
+    data = text.encode("utf-8")
+    key = hashlib.sha256(data).hexdigest()
+    path = _blob_path(key)
+    if not path.exists():
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # unique per writer: threads storing the same text must not share a temp file
+        fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f"{path.name}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(zlib.compress(data, COMPRESS_LEVEL))
+            if path.exists():
+                os.unlink(tmp)  # stored meanwhile by another writer, same content
+            else:
+                match_file_mode(tmp, path)
+                os.replace(tmp, path)
+        except BaseException:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            raise
+    return key
+
+
+@lru_cache(maxsize=256)
+def get_text(key):
+    """Text stored under key. Raises FileNotFoundError for an unknown key."""
+    return zlib.decompress(_blob_path(key).read_bytes()).decode("utf-8")
+
+
+def _present(v):
+    return isinstance(v, str) and v != ""
+
+
+def resolve(row, column):
+    """
+    Text of `column` ("raw_text" or "parsed_json") for a documents row (dict
+    or Series): loaded from its <column>_blob hash, or the legacy inline value.
+    """
+    key = row.get(f"{column}_blob")
+    if _present(key):
+        return get_text(key)
+    value = row.get(column)
+    return value if _present(value) else None
+
+
+def resolve_column(df, column):
+    """resolve() over every row of a documents frame, as a Series aligned to df."""
+    blobs = df[f"{column}_blob"] if f"{column}_blob" in df.columns else pd.Series(None, index=df.index, dtype=object)
+    inline = df[column] if column in df.columns else pd.Series(None, index=df.index, dtype=object)
+    return pd.Series(
+        [get_text(k) if _present(k) else (v if _present(v) else None) for k, v in zip(blobs, inline)],
+        index=df.index, dtype=object,
+    )
+
+
+def externalize(df):
+    """Move inline raw_text / parsed_json of a documents frame into blobs (in place); returns rows moved."""
+    moved = 0
+    for column in ("raw_text", "parsed_json"):
+        if column not in df.columns:
+            continue
+        blob_col = f"{column}_blob"
+        if blob_col not in df.columns:
+            df[blob_col] = None
+        df[blob_col] = df[blob_col].astype(object)
+        inline = df[column].map(_present) & ~df[blob_col].map(_present)
+        df.loc[inline, blob_col] = [put_text(v) for v in df.loc[inline, column]]
+        df[column] = None
+        moved += int(inline.sum())
+    return moved
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Move inline document text into the blob store.")
+    parser.add_argument("--chunksize", type=int, default=5000, help="rows per chunk (default 5000)")
+    args = parser.parse_args(argv)
+
+    import storage
+    from ocr_pipeline import DOCS_CSV
+    from utils import atomic_save_csv, file_version, iter_table_csv
+
+    moved = 0
+    if storage.use_sqlite():
+        store = storage.get_store()
+        for chunk in store.iter_table("documents", args.chunksize):
+            moved += externalize(chunk)
+            store.update_rows("documents", chunk, ["raw_text", "parsed_json", "raw_text_blob", "parsed_json_blob"])
+    elif DOCS_CSV.exists() and os.path.getsize(DOCS_CSV) > 0:
+        chunks = []
+        version = file_version(DOCS_CSV)
+        for chunk in iter_table_csv(DOCS_CSV, "documents", args.chunksize):
+            moved += externalize(chunk)
+            chunks.append(chunk)
+        if moved:
+            atomic_save_csv(pd.concat(chunks, ignore_index=True), DOCS_CSV, expected_version=version)
+    print(f"Moved text of {moved} field(s) into {BLOB_DIR}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
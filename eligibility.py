@@ -0,0 +1,158 @@
+# eligibility.py
+"""
+Match score of every applicant against every bank, for ops reporting
+(e.g. which banks would approve most of a college's cohort).
+
+    python eligibility.py [--out data/reports/eligibility.parquet] [--chunk-users 10000]
+                          [--format auto|parquet|npy] [--threshold 75]
+
+Each applicant's latest extracted_gpa / extracted_income / loan amount (the
+newest non-empty value of each across their documents) is scored against
+the bank catalog with bank_matching.score_matrix(), using the same compiled
+bank_rules as the Recommendations page. Applicants are scored chunk by chunk, so memory holds
+one chunk of the matrix at a time.
+
+Output is one int8 score per applicant and bank:
+
+* parquet (needs pyarrow): one row per applicant with columns user, college
+  and one column per bank ("bank_<id>"), one row group per chunk;
+* npy (fallback): a users x banks matrix written through a memmap, plus
+  <out>.users.csv and <out>.banks.csv naming its rows and columns.
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # parquet output is optional
+    pa = None
+
+import storage
+from bank_matching import score_matrix
+from bank_rules import CompiledRules, compiled_catalog
+from ocr_pipeline import DOCS_CSV
+from utils import read_table_csv
+
+REPORTS_DIR = Path("data") / "reports"
+APPLICANT_FIELDS = ["extracted_gpa", "extracted_income", "extracted_loan_amount", "extracted_college"]
+SCORED_FIELDS = ["extracted_gpa", "extracted_income", "extracted_loan_amount"]
+
+
+def load_applicants(users=None):
+    """
+    One row per applicant (user: email, or user_id for older rows) with the
+    newest non-empty value of each APPLICANT_FIELDS field across their
+    documents; the SCORED_FIELDS as floats (NaN if unusable). Only `users`
+    when given.
+    """
+    if storage.use_sqlite():
+        docs = storage.get_store().read_table("documents", ["doc_id", "email"] + APPLICANT_FIELDS)
+    else:
+        docs = read_table_csv(DOCS_CSV, "documents", ["doc_id", "email", "user_id"] + APPLICANT_FIELDS)
+    user = docs["email"].astype(object).where(docs["email"].notna(), None)
+    if "user_id" in docs.columns:
+        legacy = user.isna() & docs["user_id"].notna()
+        user[legacy] = docs.loc[legacy, "user_id"].astype(str)
+    docs = docs.assign(user=user).dropna(subset=["user"])
+    if users is not None:
+        docs = docs[docs["user"].isin(list(users))]
+    docs = docs.sort_values("doc_id", kind="stable")
+    # GroupBy.last() takes the last non-null value per column
+    latest = docs.groupby("user", sort=True)[APPLICANT_FIELDS].last().reset_index()
+    for col in SCORED_FIELDS:
+        latest[col] = pd.to_numeric(latest[col], errors="coerce").astype(float)
+    return latest
+
+
+def iter_score_chunks(applicants, banks, chunk_users, rules=None):
+    """Yield (applicants slice, users x banks int8 scores) for each chunk of applicants."""
+    rules = rules or CompiledRules(banks)  # compiled once for every chunk
+    for start in range(0, len(applicants), chunk_users):
+        part = applicants.iloc[start:start + chunk_users]
+        yield part, score_matrix({f: part[f].to_numpy() for f in SCORED_FIELDS}, banks, rules)
+
+
+def _bank_columns(banks):
+    return [f"bank_{int(b)}" for b in banks["bank_id"]]
+
+
+def write_parquet(chunks, banks, out):
+    """Write (applicants, scores) chunks to a parquet file, one row group per chunk."""
+    schema = pa.schema([("user", pa.string()), ("college", pa.string())]
+                       + [(c, pa.int8()) for c in _bank_columns(banks)])
+    with pq.ParquetWriter(out, schema, compression="zstd") as writer:
+        for part, scores in chunks:
+            college = part["extracted_college"].astype(object)
+            arrays = [pa.array(part["user"].astype(str).tolist()),
+                      pa.array(college.where(college.notna(), None).tolist(), type=pa.string())]
+            arrays += [pa.array(scores[:, j]) for j in range(scores.shape[1])]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+
+
+def write_npy(chunks, applicants, banks, out):
+    """Write (applicants, scores) chunks into a users x banks .npy memmap plus its row/column index files."""
+    matrix = np.lib.format.open_memmap(out, mode="w+", dtype=np.int8, shape=(len(applicants), len(banks)))
+    row = 0
+    for part, scores in chunks:
+        matrix[row:row + len(part)] = scores
+        row += len(part)
+    matrix.flush()
+    del matrix
+    applicants[["user", "extracted_college"]].rename(columns={"extracted_college": "college"}) \
+        .to_csv(f"{out}.users.csv", index_label="row")
+    banks[["bank_id", "bank_name"]].to_csv(f"{out}.banks.csv", index_label="column")
+
+
+def count_approvals(chunks, counts, threshold):
+    """Pass chunks through, adding per bank the applicants scoring at least threshold to counts."""
+    for part, scores in chunks:
+        counts += (scores >= threshold).sum(axis=0)
+        yield part, scores
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score every applicant against every bank.")
+    parser.add_argument("--out", type=Path, default=None,
+                        help="output file (default data/reports/eligibility.parquet or .npy)")
+    parser.add_argument("--format", choices=("auto", "parquet", "npy"), default="auto",
+                        help="parquet needs pyarrow; auto uses it when installed")
+    parser.add_argument("--chunk-users", type=int, default=10000, help="applicants scored per chunk")
+    parser.add_argument("--threshold", type=int, default=75,
+                        help="score counted as a likely approval in the summary (default 75)")
+    args = parser.parse_args(argv)
+
+    fmt = args.format
+    if fmt == "auto":
+        fmt = "parquet" if pa is not None else "npy"
+    elif fmt == "parquet" and pa is None:
+        parser.error("--format parquet needs pyarrow (pip install pyarrow)")
+    out = args.out or REPORTS_DIR / f"eligibility.{fmt}"
+    out.parent.mkdir(parents=True, exist_ok=True)
+
+    t0 = time.perf_counter()
+    applicants = load_applicants()
+    banks, rules = compiled_catalog()
+    approvals = np.zeros(len(banks), dtype=np.int64)
+    chunks = count_approvals(iter_score_chunks(applicants, banks, args.chunk_users, rules), approvals, args.threshold)
+    if fmt == "parquet":
+        write_parquet(chunks, banks, out)
+    else:
+        write_npy(chunks, applicants, banks, out)
+    elapsed = time.perf_counter() - t0
+    print(f"Scored {len(applicants)} applicants x {len(banks)} banks in {elapsed:.2f}s -> {out}")
+
+    print(f"Applicants scoring >= {args.threshold}, per bank:")
+    summary = pd.Series(approvals, index=banks["bank_name"].astype(str)).sort_values(ascending=False, kind="stable")
+    for name, n in summary.items():
+        print(f"  {name}: {n}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
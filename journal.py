@@ -0,0 +1,387 @@
+# journal.py
+"""
+Append-only journals for applications, their status events, appointments
+and takeovers.
+
+Every insert is one JSON line appended to data/journal/<table>.jsonl with a
+single O_APPEND write, so a submit costs the same however large the table
+grows and concurrent sessions can no longer overwrite each other's rows.
+
+The familiar data/<table>.csv is kept as a compacted snapshot: a small meta
+file records how many journal bytes the snapshot already contains, and
+readers load the snapshot plus the journal tail after that offset. The
+journal itself is never truncated, so if the snapshot and meta ever disagree
+(e.g. a crash mid-compaction) the table is rebuilt by replaying the journal.
+On first use the rows of an existing CSV are copied into the journal.
+
+Each table also keeps a per-user index: for every user, a small file under
+data/journal/by_user/<table>/ listing the byte offset and length of that
+user's journal lines. read_user_rows() seeks to just those lines, so a
+user's listing costs their own history, not the table size.
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+
+import pandas as pd
+
+from utils import apply_schema, atomic_save_csv, file_lock, file_version, read_table_csv
+
+DATA_DIR = Path("data")
+JOURNAL_DIR = DATA_DIR / "journal"
+
+TABLES = {
+    "applications": ["app_id", "user_email", "bank_id", "status", "filled_form_fields_json", "timestamp"],
+    "appointments": ["appointment_id", "app_id", "user_email", "bank_id", "scheduled_time", "created_at", "status"],
+    "takeovers": ["user_email", "app_id", "new_bank_id", "new_bank_name", "new_rate",
+                  "remaining_principal", "requested_at", "status"],
+    "application_events": ["app_id", "status", "changed_at", "note"],
+}
+
+# "always": fsync every append; "interval": at most once per
+# JOURNAL_FSYNC_INTERVAL seconds; "never": leave it to the OS.
+JOURNAL_FSYNC = os.environ.get("FINBRIDGE_JOURNAL_FSYNC", "always")
+JOURNAL_FSYNC_INTERVAL = float(os.environ.get("FINBRIDGE_JOURNAL_FSYNC_INTERVAL", 1.0))
+# Fold the journal tail into the snapshot once it grows past this many bytes.
+JOURNAL_COMPACT_BYTES = int(os.environ.get("FINBRIDGE_JOURNAL_COMPACT_BYTES", 4 * 1024 * 1024))
+
+# read_table() attempts before falling back to the whole journal when
+# compactions keep replacing the snapshot under it
+READ_RETRIES = 5
+
+# column whose value keys the per-user index (user_id: rows from older data)
+USER_KEYS = ("user_email", "user_id")
+
+_lock = threading.Lock()
+_last_fsync = {}
+_compacting = set()
+
+
+# -----------------------------------------------------
+# Paths and locking
+# -----------------------------------------------------
+def snapshot_path(table):
+    return DATA_DIR / f"{table}.csv"
+
+
+def journal_path(table):
+    return JOURNAL_DIR / f"{table}.jsonl"
+
+
+def _meta_path(table):
+    return JOURNAL_DIR / f"{table}.meta.json"
+
+
+def _file_lock(table, blocking=True):
+    """Exclusive inter-process lock for one table; yields False if non-blocking and busy."""
+    return file_lock(JOURNAL_DIR / f"{table}.lock", blocking)
+
+
+# -----------------------------------------------------
+# Journal records
+# -----------------------------------------------------
+def _encode(row):
+    return (json.dumps(row, ensure_ascii=False, default=str) + "\n").encode("utf-8")
+
+
+def _read_lines(table, start=0):
+    """Complete journal lines from byte offset start as [(offset, length, record)], plus the end offset."""
+    path = journal_path(table)
+    if not path.exists():
+        return [], start
+    with open(path, "rb") as f:
+        f.seek(start)
+        data = f.read()
+    end = data.rfind(b"\n") + 1  # a torn final line is left for a later read
+    out = []
+    pos = 0
+    while pos < end:
+        nl = data.index(b"\n", pos) + 1
+        try:
+            out.append((start + pos, nl - pos, json.loads(data[pos:nl])))
+        except ValueError:
+            pass
+        pos = nl
+    return out, start + end
+
+
+def _read_records(table, start=0):
+    """Parse complete journal lines from byte offset start; returns (records, end offset)."""
+    lines, end = _read_lines(table, start)
+    return [rec for _, _, rec in lines], end
+
+
+def read_since(table, offset=0):
+    """Journal rows appended after byte offset; returns (rows, new offset)."""
+    _ensure_journal(table)
+    return _read_records(table, offset)
+
+
+def _migrate(table):
+    """Seed a new journal with the rows of the existing CSV (caller holds the file lock)."""
+    path = journal_path(table)
+    if path.exists():
+        return
+    snap = snapshot_path(table)
+    rows = []
+    if snap.exists() and os.path.getsize(snap) > 0:
+        try:
+            # via to_json so NaN becomes null and numpy scalars plain JSON
+            rows = json.loads(pd.read_csv(snap).to_json(orient="records", force_ascii=False))
+        except pd.errors.EmptyDataError:
+            pass
+    tmp = Path(str(path) + ".tmp")
+    with open(tmp, "wb") as f:
+        for row in rows:
+            f.write(_encode(row))
+        f.flush()
+        os.fsync(f.fileno())
+    tmp.replace(path)
+    # the CSV already holds exactly these rows
+    if snap.exists():
+        _write_meta(table, path.stat().st_size, snap.stat().st_size)
+
+
+def _ensure_journal(table):
+    if not journal_path(table).exists():
+        with _file_lock(table):
+            _migrate(table)
+
+
+def _maybe_fsync(table, fd):
+    if JOURNAL_FSYNC == "always":
+        os.fsync(fd)
+    elif JOURNAL_FSYNC == "interval":
+        now = time.monotonic()
+        if now - _last_fsync.get(table, 0.0) >= JOURNAL_FSYNC_INTERVAL:
+            os.fsync(fd)
+            _last_fsync[table] = now
+
+
+def append(table, row):
+    """Append one row to the table's journal (and its user's index) and return it."""
+    _ensure_journal(table)
+    line = _encode(row)
+    with _lock, _file_lock(table):
+        fd = os.open(journal_path(table), os.O_WRONLY | os.O_APPEND)
+        try:
+            start = os.fstat(fd).st_size  # exact: every writer holds the table lock
+            os.write(fd, line)
+            _maybe_fsync(table, fd)
+            size = os.fstat(fd).st_size
+        finally:
+            os.close(fd)
+        _index_user_row(table, row, start, len(line))
+    if size - _read_meta(table).get("offset", 0) >= JOURNAL_COMPACT_BYTES:
+        _compact_in_background(table)
+    return row
+
+
+# -----------------------------------------------------
+# Per-user index
+# -----------------------------------------------------
+def _user_key(row):
+    for col in USER_KEYS:
+        v = row.get(col)
+        if v is not None and v == v and str(v) != "":
+            return str(v)
+    return None
+
+
+def _user_index_path(table, user):
+    digest = hashlib.sha1(user.encode("utf-8")).hexdigest()
+    return JOURNAL_DIR / "by_user" / table / digest[:2] / f"{digest}.idx"
+
+
+def _user_meta_path(table):
+    return JOURNAL_DIR / f"{table}.by_user.json"
+
+
+def _indexed_to(table):
+    try:
+        with open(_user_meta_path(table), encoding="utf-8") as f:
+            return json.load(f)["indexed_to"]
+    except (OSError, ValueError, KeyError):
+        return 0
+
+
+def _set_indexed_to(table, offset):
+    path = _user_meta_path(table)
+    tmp = Path(str(path) + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"indexed_to": offset}, f)
+    tmp.replace(path)
+
+
+def _write_index_entries(table, entries):
+    """entries: {user: [(offset, length), ...]}, appended to each user's index file."""
+    for user, spans in entries.items():
+        path = _user_index_path(table, user)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "a", encoding="ascii") as f:
+            f.writelines(f"{off} {n}\n" for off, n in spans)
+
+
+def _has_user_index(table):
+    return "user_email" in TABLES[table]
+
+
+def _index_user_row(table, row, offset, length):
+    # caller holds the table lock
+    if not _has_user_index(table):
+        return
+    user = _user_key(row)
+    if user is not None:
+        _write_index_entries(table, {user: [(offset, length)]})
+    if _indexed_to(table) == offset:
+        _set_indexed_to(table, offset + length)
+
+
+def _catch_up_user_index(table):
+    """Index journal lines that were not written through append() (seeded rows, older versions)."""
+    done = _indexed_to(table)
+    path = journal_path(table)
+    if not path.exists() or path.stat().st_size == done:
+        return
+    with _file_lock(table):
+        done = _indexed_to(table)
+        if path.stat().st_size < done:
+            # the journal was replaced (e.g. re-seeded from the CSV): start over
+            shutil.rmtree(JOURNAL_DIR / "by_user" / table, ignore_errors=True)
+            done = 0
+        lines, end = _read_lines(table, done)
+        entries = {}
+        for off, n, rec in lines:
+            user = _user_key(rec)
+            if user is not None:
+                entries.setdefault(user, []).append((off, n))
+        _write_index_entries(table, entries)
+        _set_indexed_to(table, end)
+
+
+def read_user_rows(table, user):
+    """Journal rows of one user (by user_email, or user_id for older rows), oldest first."""
+    if not _has_user_index(table):
+        raise ValueError(f"{table} has no user column")
+    _ensure_journal(table)
+    _catch_up_user_index(table)
+    try:
+        with open(_user_index_path(table, str(user)), encoding="ascii") as f:
+            spans = sorted({tuple(map(int, ln.split())) for ln in f if ln.strip()})
+    except FileNotFoundError:
+        return []
+    rows = []
+    with open(journal_path(table), "rb") as f:
+        for off, n in spans:
+            f.seek(off)
+            rec = json.loads(f.read(n))
+            if _user_key(rec) == str(user):  # guards against a hash collision
+                rows.append(rec)
+    return rows
+
+
+# -----------------------------------------------------
+# Snapshot
+# -----------------------------------------------------
+def _read_meta(table):
+    try:
+        with open(_meta_path(table), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_meta(table, offset, snapshot_bytes):
+    path = _meta_path(table)
+    tmp = Path(str(path) + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"offset": offset, "snapshot_bytes": snapshot_bytes}, f)
+    tmp.replace(path)
+
+
+def _frame(table, records):
+    df = pd.DataFrame(records)
+    cols = TABLES[table] + [c for c in df.columns if c not in TABLES[table]]
+    return df.reindex(columns=cols)
+
+
+def _snapshot_valid(table, meta):
+    snap = snapshot_path(table)
+    return bool(meta) and snap.exists() and snap.stat().st_size == meta.get("snapshot_bytes")
+
+
+def read_table(table, columns=None):
+    """
+    Current contents of table as a typed DataFrame: snapshot + journal tail.
+    With columns, only those are parsed from the snapshot and returned.
+    """
+    _ensure_journal(table)
+    for _ in range(READ_RETRIES):
+        meta = _read_meta(table)
+        version = file_version(snapshot_path(table))
+        if not meta or version is None or version[2] != meta.get("snapshot_bytes"):
+            meta = {}
+            break
+        snap = read_table_csv(snapshot_path(table), table, columns)
+        # compact() may have replaced the snapshot meanwhile; the new one already
+        # holds rows past meta["offset"], so reading that tail would repeat them
+        if file_version(snapshot_path(table)) == version and _read_meta(table) == meta:
+            break
+    else:
+        meta = {}
+    if not meta:
+        records, _ = _read_records(table)
+        df = _frame(table, records)
+        return apply_schema(df if columns is None else df.reindex(columns=columns), table)
+    tail, _ = _read_records(table, meta["offset"])
+    if not tail:
+        return snap
+    tail = _frame(table, tail)
+    if columns is not None:
+        tail = tail.reindex(columns=columns)
+    return apply_schema(pd.concat([snap, tail], ignore_index=True), table)
+
+
+def compact(table):
+    """
+    Fold the journal tail into data/<table>.csv. Returns False if another
+    process is already compacting this table.
+    """
+    _ensure_journal(table)
+    with _file_lock(f"{table}.compact", blocking=False) as acquired:
+        if not acquired:
+            return False
+        meta = _read_meta(table)
+        if _snapshot_valid(table, meta):
+            tail, end = _read_records(table, meta["offset"])
+            if not tail:
+                return True
+            # read as text so existing rows are written back unchanged
+            snap = pd.read_csv(snapshot_path(table), dtype=str, keep_default_na=False)
+            df = pd.concat([snap, _frame(table, tail)], ignore_index=True)
+        else:
+            records, end = _read_records(table)
+            df = _frame(table, records)
+        atomic_save_csv(df, snapshot_path(table))
+        _write_meta(table, end, snapshot_path(table).stat().st_size)
+    return True
+
+
+def _compact_in_background(table):
+    with _lock:
+        if table in _compacting:
+            return
+        _compacting.add(table)
+
+    def run():
+        try:
+            compact(table)
+        finally:
+            with _lock:
+                _compacting.discard(table)
+
+    threading.Thread(target=run, name=f"journal-compact-{table}", daemon=True).start()
@@ -0,0 +1,217 @@
+# ocr_jobs.py
+"""
+Background OCR job queue.
+
+Uploads are submitted as jobs and run by a small thread pool, so the
+Streamlit script thread never blocks inside process_upload(). Every state
+change is persisted to data/ocr_jobs.csv. Each job records the host and pid
+of the process running it; a process writes back only the jobs it owns, and
+on start it claims and re-queues the queued or running jobs whose owner is
+no longer alive.
+"""
+import json
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pandas as pd
+
+from utils import ensure_dirs, now_iso, atomic_save_csv, next_id, table_lock
+from ocr_pipeline import process_upload, find_doc
+
+ensure_dirs()
+JOBS_CSV = Path("data") / "ocr_jobs.csv"
+JOB_COLUMNS = [
+    "job_id", "user_email", "file_paths", "status",
+    "submitted_at", "started_at", "finished_at", "queue_wait_s", "duration_s",
+    "pages_done", "pages_total", "doc_id", "error", "owner_host", "owner_pid",
+]
+HOST = socket.gethostname()
+OCR_JOB_WORKERS = int(os.environ.get("OCR_JOB_WORKERS", 2))
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+_lock = threading.RLock()
+_jobs = None        # job_id -> job dict, loaded from JOBS_CSV on first use
+_owned = set()      # job ids this process submitted or claimed; the only rows it writes
+_results = {}       # job_id -> document row returned by process_upload
+_executor = None
+
+
+# -----------------------------------------------------
+# Persistence
+# -----------------------------------------------------
+def _load_jobs():
+    if not JOBS_CSV.exists() or os.path.getsize(JOBS_CSV) == 0:
+        return {}
+    df = pd.read_csv(JOBS_CSV, dtype={"user_email": str, "file_paths": str, "status": str, "error": str,
+                                      "owner_host": str})
+    jobs = {}
+    for rec in df.to_dict("records"):
+        rec = {k: (None if pd.isna(v) else v) for k, v in rec.items()}
+        rec["job_id"] = int(rec["job_id"])
+        jobs[rec["job_id"]] = rec
+    return jobs
+
+
+def _save_jobs():
+    # caller holds _lock. The file is re-read under the table lock and only
+    # this process's own jobs are written over it; the other rows are kept as
+    # their owners last wrote them (and refreshed in _jobs).
+    with table_lock("ocr_jobs"):
+        merged = _load_jobs()
+        for job_id, job in merged.items():
+            if job_id not in _owned:
+                _jobs[job_id] = job
+        merged.update({j: _jobs[j] for j in _owned})
+        df = pd.DataFrame([merged[j] for j in sorted(merged)], columns=JOB_COLUMNS)
+        atomic_save_csv(df, JOBS_CSV)
+
+
+def _pid_alive(pid):
+    if os.name == "nt":
+        import ctypes
+        handle = ctypes.windll.kernel32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+        if not handle:
+            return False
+        ctypes.windll.kernel32.CloseHandle(handle)
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _orphaned(job):
+    """True if the process that owns job is gone (jobs from before owners were recorded count as orphaned)."""
+    if job.get("owner_pid") is None:
+        return True
+    if job.get("owner_host") != HOST:
+        return False  # can't tell from here; left to a process on that host
+    pid = int(job["owner_pid"])
+    # our own pid here is a reused one: this process has not claimed anything yet
+    return pid == os.getpid() or not _pid_alive(pid)
+
+
+def _elapsed(start_iso, end_iso):
+    return round((pd.Timestamp(end_iso) - pd.Timestamp(start_iso)).total_seconds(), 3)
+
+
+# -----------------------------------------------------
+# Worker
+# -----------------------------------------------------
+def _ensure_started():
+    global _jobs, _executor
+    with _lock:
+        if _executor is not None:
+            return
+        _executor = ThreadPoolExecutor(max_workers=OCR_JOB_WORKERS, thread_name_prefix="ocr-job")
+        # Jobs left queued or running by a process that died are claimed and
+        # picked up again so a crash never loses submitted work. Checked and
+        # claimed under the table lock so two starting processes can't both
+        # take the same job.
+        with table_lock("ocr_jobs"):
+            _jobs = _load_jobs()
+            recovered = [j for j in sorted(_jobs)
+                         if _jobs[j]["status"] in (QUEUED, RUNNING) and _orphaned(_jobs[j])]
+            for job_id in recovered:
+                _jobs[job_id].update(status=QUEUED, started_at=None, pages_done=0,
+                                     owner_host=HOST, owner_pid=os.getpid())
+                _owned.add(job_id)
+            if recovered:
+                _save_jobs()
+        for job_id in recovered:
+            _executor.submit(_run_job, job_id)
+
+
+def _run_job(job_id):
+    with _lock:
+        job = _jobs[job_id]
+        job["status"] = RUNNING
+        job["started_at"] = now_iso()
+        job["queue_wait_s"] = _elapsed(job["submitted_at"], job["started_at"])
+        _save_jobs()
+        user_email = job["user_email"]
+        file_paths = json.loads(job["file_paths"])
+
+    def progress(done, total):
+        # progress is kept in memory only; state transitions are persisted
+        with _lock:
+            job["pages_done"] = done
+            job["pages_total"] = total
+
+    t0 = time.perf_counter()
+    try:
+        row = process_upload(user_email, file_paths, progress=progress)
+    except Exception as e:
+        with _lock:
+            job.update(status=FAILED, error=str(e), finished_at=now_iso(),
+                       duration_s=round(time.perf_counter() - t0, 3))
+            _save_jobs()
+        return
+
+    with _lock:
+        _results[job_id] = row
+        job.update(status=DONE, doc_id=row.get("doc_id"), finished_at=now_iso(),
+                   duration_s=round(time.perf_counter() - t0, 3))
+        _save_jobs()
+
+
+# -----------------------------------------------------
+# Public API
+# -----------------------------------------------------
+def submit_ocr_job(user_email, file_paths: list):
+    """Queue OCR + extraction of file_paths for user_email and return the job id."""
+    _ensure_started()
+    with _lock:
+        job_id = next_id("ocr_jobs", seed=lambda: max(_load_jobs(), default=0))
+        _jobs[job_id] = {
+            "job_id": job_id,
+            "user_email": str(user_email).strip(),
+            "file_paths": json.dumps([str(p) for p in file_paths]),
+            "status": QUEUED,
+            "submitted_at": now_iso(),
+            "started_at": None,
+            "finished_at": None,
+            "queue_wait_s": None,
+            "duration_s": None,
+            "pages_done": 0,
+            "pages_total": None,
+            "doc_id": None,
+            "error": None,
+            "owner_host": HOST,
+            "owner_pid": os.getpid(),
+        }
+        _owned.add(job_id)
+        _save_jobs()
+        _executor.submit(_run_job, job_id)
+    return job_id
+
+
+def get_job(job_id):
+    """Return a snapshot of the job's state, or None for an unknown id."""
+    _ensure_started()
+    with _lock:
+        job = _jobs.get(int(job_id))
+        return dict(job) if job else None
+
+
+def get_job_result(job_id):
+    """Return the document row produced by a finished job, or None."""
+    job = get_job(job_id)
+    if not job or job["status"] != DONE:
+        return None
+    with _lock:
+        if job["job_id"] in _results:
+            return _results[job["job_id"]]
+    # finished in an earlier process: read the stored row back
+    return find_doc(job["doc_id"])
@@ -1,10 +1,23 @@
 # ocr_pipeline.py (email-safe + fully fixed)
 from PIL import Image
 from pathlib import Path
+import concurrent.futures
+import hashlib
 import json
 import os
+import subprocess
+import tempfile
+import threading
+import time
+from collections import defaultdict, namedtuple
+import numpy as np
 import pandas as pd
-from utils import ensure_dirs, now_iso, atomic_save_csv
+from utils import (
+    ensure_dirs, now_iso, atomic_save_csv, allocate_ids, match_file_mode, next_id, read_table_csv, table_lock,
+)
+from ocr_pool import get_ocr_pool
+import blobstore
+import storage
 import re
 
 # -----------------------------------------------------
@@ -15,7 +28,7 @@ OCR_SUPPORT = False
 OCR_MISSING_MSG = ""
 
 try:
-    from pdf2image import convert_from_path
+    from pdf2image import convert_from_path, pdfinfo_from_path
     PDF_SUPPORT = True
 except Exception:
     PDF_SUPPORT = False
@@ -35,6 +48,53 @@ except Exception:
 ensure_dirs()
 DOCS_CSV = Path("data") / "documents.csv"
 
+# OCR settings. Anything that changes the OCR output or the extracted fields
+# must be part of the cache key below, so bump EXTRACTOR_VERSION whenever
+# extract_fields_from_text() changes.
+OCR_DPI = 200
+OCR_LANG = "eng"
+EXTRACTOR_VERSION = "1"
+
+# Page-level parallelism for multi-page PDFs. OCR_WORKERS=1 keeps the serial
+# path; OCR_PAGE_TIMEOUT is in seconds per page (0 disables it).
+OCR_WORKERS = int(os.environ.get("OCR_WORKERS", min(4, os.cpu_count() or 1)))
+OCR_PAGE_TIMEOUT = float(os.environ.get("OCR_PAGE_TIMEOUT", 120))
+# Pages rasterized at a time on the serial path; bounds peak memory per PDF.
+OCR_PAGE_WINDOW = int(os.environ.get("OCR_PAGE_WINDOW", 4))
+
+# Warm OCR worker processes (see ocr_pool.py) instead of one tesseract
+# process per page. Off by default; enable with OCR_POOL=1.
+OCR_POOL_ENABLED = os.environ.get("OCR_POOL", "0") == "1"
+OCR_POOL_SIZE = int(os.environ.get("OCR_POOL_SIZE", OCR_WORKERS))
+
+# Born-digital PDFs already carry a text layer; pages with at least
+# TEXT_LAYER_MIN_CHARS alphanumeric characters skip rasterization and OCR.
+TEXT_LAYER_ENABLED = os.environ.get("OCR_TEXT_LAYER", "1") != "0"
+TEXT_LAYER_MIN_CHARS = int(os.environ.get("TEXT_LAYER_MIN_CHARS", 20))
+
+# Image clean-up before Tesseract; see preprocess_image(). Off by default
+# (about 0.35 s per 200-DPI page, with no accuracy benchmark behind it yet);
+# enable with OCR_PREPROCESS=1. Every step can also be switched off on its own.
+PREPROCESS_ENABLED = os.environ.get("OCR_PREPROCESS", "0") == "1"
+PREPROCESS_STEPS = {
+    "grayscale": True,
+    "crop": True,
+    "deskew": True,
+    "downscale": True,
+    "binarize": True,
+}
+PREPROCESS_OPTIONS = {
+    "binarize_window": 31,      # px, side of the local window (odd)
+    "binarize_k": 0.2,          # Sauvola sensitivity
+    "deskew_max_angle": 5.0,    # degrees searched either side of level
+    "deskew_step": 0.5,
+    "crop_margin": 12,          # px of white kept around the text
+    "target_char_height": 32,   # px; Tesseract is most accurate around 30 px
+}
+
+OCR_CACHE_DIR = Path("data") / "ocr_cache"
+OCR_CACHE_MAX_BYTES = int(os.environ.get("OCR_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+
 
 # -----------------------------------------------------
 # Helpers
@@ -49,180 +109,878 @@ def _ensure_pdf():
         raise RuntimeError(f"PDF support not available: {OCR_MISSING_MSG}")
 
 
+class OcrPageError(RuntimeError):
+    """OCR of a single PDF page failed or timed out."""
+
+    def __init__(self, page_no, reason):
+        super().__init__(f"OCR failed on page {page_no}: {reason}")
+        self.page_no = page_no
+        self.reason = reason
+
+
+DOC_COLUMNS = [
+    'doc_id', 'email', 'upload_time', 'source_files',
+    'extracted_name', 'extracted_course', 'extracted_gpa', 'extracted_income', 'extracted_admission_year',
+    'raw_text_blob', 'parsed_json_blob', 'page_sources', 'source_hashes'
+]
+IMAGE_SUFFIXES = ('.png', '.jpg', '.jpeg', '.tiff', '.bmp', '.gif')
+
+
 def _load_docs():
     """Ensure documents.csv exists and has correct columns"""
-    expected_cols = [
-        'doc_id', 'email', 'upload_time', 'source_files',
-        'extracted_name', 'extracted_course', 'extracted_gpa', 'extracted_income', 'extracted_admission_year',
-        'raw_text', 'parsed_json'
-    ]
+    expected_cols = DOC_COLUMNS
+    if storage.use_sqlite():
+        df = storage.get_store().read_table("documents")
+        return df.reindex(columns=list(df.columns) + [c for c in expected_cols if c not in df.columns])
     if not os.path.exists(DOCS_CSV) or os.path.getsize(DOCS_CSV) == 0:
         df = pd.DataFrame(columns=expected_cols)
         df.to_csv(DOCS_CSV, index=False)
         return df
     else:
-        df = pd.read_csv(DOCS_CSV)
+        df = read_table_csv(DOCS_CSV, "documents")
         for c in expected_cols:
             if c not in df.columns:
                 df[c] = None
         return df
 
 
+def append_docs(rows, recommend=True):
+    """
+    Append document rows to documents.csv in one write, without re-reading or
+    rewriting the existing rows. The file is rewritten once only when the rows
+    carry columns its header does not have yet. The users' precomputed
+    recommendations are updated afterwards unless recommend is False (bulk
+    loads rebuild them once at the end with recommendations.rebuild_users()).
+    """
+    if not rows:
+        return
+    _write_docs(rows)
+    if not recommend:
+        return
+    import recommendations  # imports bank_matching / streamlit; only needed once rows exist
+    recommendations.record_documents(rows)
+
+
+def _write_docs(rows):
+    if storage.use_sqlite():
+        storage.get_store().insert_many("documents", rows)
+        return
+    with table_lock("documents"):
+        header = []
+        if os.path.exists(DOCS_CSV) and os.path.getsize(DOCS_CSV) > 0:
+            header = list(pd.read_csv(DOCS_CSV, nrows=0).columns)
+        new_cols = {c for row in rows for c in row} | set(DOC_COLUMNS)
+        if not header or not new_cols.issubset(header):
+            df = pd.concat([_load_docs(), pd.DataFrame(rows)], ignore_index=True)
+            atomic_save_csv(df, DOCS_CSV)
+            return
+        pd.DataFrame(rows).reindex(columns=header).to_csv(DOCS_CSV, mode="a", header=False, index=False)
+
+
 def _append_doc(row):
-    df = _load_docs()
-    df = pd.concat([df, pd.DataFrame([row])], ignore_index=True)
-    atomic_save_csv(df, DOCS_CSV)
+    append_docs([row])
+
+
+def _max_doc_id():
+    """Largest stored doc_id (0 if none), reading only the doc_id column; seeds the sequence."""
+    if storage.use_sqlite():
+        return storage.get_store().max_value("documents", "doc_id")
+    if not DOCS_CSV.exists() or os.path.getsize(DOCS_CSV) == 0:
+        return 0
+    ids = read_table_csv(DOCS_CSV, "documents", ["doc_id"])["doc_id"]
+    return int(ids.max()) if ids.notna().any() else 0
+
+
+def next_doc_id():
+    """Next doc_id from the documents id sequence."""
+    return next_id("documents", seed=_max_doc_id)
+
+
+def allocate_doc_ids(count):
+    """A block of count consecutive doc_ids, for bulk inserts."""
+    return allocate_ids("documents", count, seed=_max_doc_id)
+
+
+def doc_text(doc, column="raw_text"):
+    """raw_text (or parsed_json) of a stored documents row, loaded from the blob store on demand."""
+    return blobstore.resolve(doc, column)
+
+
+def find_doc(doc_id):
+    """The last stored row for doc_id as a dict (text left in the blob store), or None."""
+    if storage.use_sqlite():
+        rows = storage.get_store().find("documents", "doc_id", int(doc_id))
+        return rows[-1] if rows else None
+    docs = _load_docs()
+    match = docs[docs["doc_id"] == doc_id]
+    if match.empty:
+        return None
+    return {k: (None if pd.isna(v) else v) for k, v in match.iloc[-1].to_dict().items()}
+
+
+def file_sha256(path):
+    """Return the hex SHA-256 of a file's bytes, read in 1 MB chunks."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+# -----------------------------------------------------
+# OCR Result Cache
+# -----------------------------------------------------
+class OcrCache:
+    """Size-bounded on-disk cache of OCR results.
+
+    Entries are keyed by the SHA-256 of the file bytes plus the OCR settings
+    (DPI, language, extractor version) and stored as one JSON file per key.
+    A hit refreshes the entry's mtime, so evicting the oldest mtimes first
+    gives LRU behaviour across processes without a separate index file.
+    """
+
+    def __init__(self, root, max_bytes):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    def key_for(self, path, dpi=OCR_DPI, lang=OCR_LANG, digest=None):
+        digest = digest or file_sha256(path)
+        settings = (f"dpi={dpi};lang={lang};extractor={EXTRACTOR_VERSION};"
+                    f"text_layer={int(TEXT_LAYER_ENABLED)};preprocess={_preprocess_signature()};"
+                    f"pool={int(OCR_POOL_ENABLED)}")
+        return hashlib.sha256(f"{digest}|{settings}".encode("utf-8")).hexdigest()
+
+    def _entry_path(self, key):
+        return self.root / f"{key}.json"
+
+    def get(self, key):
+        path = self._entry_path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+            os.utime(path)  # mark as most recently used
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return entry
+
+    def put(self, key, entry):
+        self.root.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False)
+        match_file_mode(tmp, self._entry_path(key))
+        os.replace(tmp, self._entry_path(key))
+        self._evict()
+
+    def _evict(self):
+        entries = []
+        total = 0
+        for e in os.scandir(self.root):
+            if not e.name.endswith(".json"):
+                continue
+            try:
+                st = e.stat()
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, e.path))
+            total += st.st_size
+        if total <= self.max_bytes:
+            return
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            with self._lock:
+                self.evictions += 1
+
+    def clear(self):
+        if self.root.exists():
+            for e in os.scandir(self.root):
+                if e.name.endswith(".json"):
+                    os.remove(e.path)
+
+    def stats(self):
+        entries = 0
+        size = 0
+        if self.root.exists():
+            for e in os.scandir(self.root):
+                if e.name.endswith(".json"):
+                    entries += 1
+                    size += e.stat().st_size
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": entries,
+                "bytes": size,
+                "max_bytes": self.max_bytes,
+            }
+
+
+OCR_CACHE = OcrCache(OCR_CACHE_DIR, OCR_CACHE_MAX_BYTES)
+
+
+def ocr_cache_stats():
+    return OCR_CACHE.stats()
+
+
+# -----------------------------------------------------
+# Image Preprocessing
+# -----------------------------------------------------
+_preprocess_totals = defaultdict(float)
+_preprocess_counts = defaultdict(int)
+_preprocess_lock = threading.Lock()
+
+
+def _preprocess_signature():
+    if not PREPROCESS_ENABLED:
+        return "off"
+    on = ",".join(k for k, v in PREPROCESS_STEPS.items() if v)
+    opts = ",".join(f"{k}={v}" for k, v in sorted(PREPROCESS_OPTIONS.items()))
+    return f"{on}|{opts}"
+
+
+def _binarize(gray, window, k):
+    """Sauvola adaptive threshold using integral images; returns uint8 0/255."""
+    r = window // 2
+    padded = np.pad(gray, r + 1, mode="edge").astype(np.int64)
+    s1 = padded.cumsum(0).cumsum(1)
+    s2 = (padded * padded).cumsum(0).cumsum(1)
+    h, w = gray.shape
+    y0, y1 = slice(0, h), slice(window, window + h)
+    x0, x1 = slice(0, w), slice(window, window + w)
+    area = float(window * window)
+    mean = (s1[y1, x1] - s1[y0, x1] - s1[y1, x0] + s1[y0, x0]) / area
+    var = (s2[y1, x1] - s2[y0, x1] - s2[y1, x0] + s2[y0, x0]) / area - mean * mean
+    threshold = mean * (1.0 + k * (np.sqrt(np.maximum(var, 0.0)) / 128.0 - 1.0))
+    return np.where(gray > threshold, 255, 0).astype(np.uint8)
+
+
+def _ink_mask(gray):
+    """Global Otsu threshold; a cheap ink mask for the geometric steps."""
+    hist = np.bincount(gray.ravel(), minlength=256).astype(np.float64)
+    levels = np.arange(256)
+    w0 = hist.cumsum()
+    w1 = w0[-1] - w0
+    m0 = (hist * levels).cumsum()
+    mu0 = m0 / np.maximum(w0, 1)
+    mu1 = (m0[-1] - m0) / np.maximum(w1, 1)
+    between = w0 * w1 * (mu0 - mu1) ** 2
+    return gray <= int(np.argmax(between))
+
+
+def _skew_angle(ink, max_angle, step):
+    """
+    Angle (degrees) whose rotation gives the sharpest row profile; 0.0 for a
+    page without ink or when no angle scores strictly better than level.
+    """
+    if not ink.any():
+        return 0.0
+    img = Image.fromarray(np.where(ink, 0, 255).astype(np.uint8))
+    if img.width > 1000:
+        img = img.resize((1000, max(1, img.height * 1000 // img.width)))
+
+    def score(angle):
+        rotated = np.asarray(img.rotate(angle, fillcolor=255)) if angle else np.asarray(img)
+        rows = (rotated < 128).sum(axis=1).astype(np.float64)
+        return float(np.sum(np.diff(rows) ** 2))
+
+    best_angle, best_score = 0.0, score(0.0)
+    for angle in np.arange(-max_angle, max_angle + step / 2, step):
+        if angle == 0:
+            continue
+        s = score(float(angle))
+        if s > best_score:
+            best_angle, best_score = float(angle), s
+    return best_angle
+
+
+def _crop_box(ink, margin):
+    """Bounding box of the text, ignoring dark scanner borders along the edges."""
+    h, w = ink.shape
+    row_fill = ink.mean(axis=1)
+    col_fill = ink.mean(axis=0)
+    top, bottom, left, right = 0, h, 0, w
+    while top < bottom and row_fill[top] > 0.8:
+        top += 1
+    while bottom > top and row_fill[bottom - 1] > 0.8:
+        bottom -= 1
+    while left < right and col_fill[left] > 0.8:
+        left += 1
+    while right > left and col_fill[right - 1] > 0.8:
+        right -= 1
+    inner = ink[top:bottom, left:right]
+    rows = np.flatnonzero(inner.any(axis=1))
+    cols = np.flatnonzero(inner.any(axis=0))
+    if rows.size == 0 or cols.size == 0:
+        return None
+    return (max(left + cols[0] - margin, 0), max(top + rows[0] - margin, 0),
+            min(left + cols[-1] + 1 + margin, w), min(top + rows[-1] + 1 + margin, h))
+
+
+def _char_height(ink):
+    """Median height of text-line bands in the row profile, or None."""
+    rows = ink.any(axis=1).astype(np.int8)
+    edges = np.diff(np.concatenate(([0], rows, [0])))
+    heights = np.flatnonzero(edges == -1) - np.flatnonzero(edges == 1)
+    heights = heights[heights > 2]
+    return float(np.median(heights)) if heights.size else None
+
+
+def preprocess_image(img, steps=None, options=None):
+    """
+    Clean up a page image for Tesseract: grayscale, border crop, deskew,
+    downscaling to a target character height and adaptive binarization.
+    The geometric steps run on a cheap Otsu ink mask and binarization runs
+    last, on the smallest image. Returns (image, timings) with the seconds
+    spent in each enabled step.
+    """
+    steps = {**PREPROCESS_STEPS, **(steps or {})}
+    opts = {**PREPROCESS_OPTIONS, **(options or {})}
+    timings = {}
+
+    def timed(name, fn):
+        t0 = time.perf_counter()
+        out = fn()
+        timings[name] = timings.get(name, 0.0) + time.perf_counter() - t0
+        return out
+
+    if not any(steps.values()):
+        return img, timings
+    # every later step works on 8-bit grayscale, so it is implied by them
+    gray = timed("grayscale", lambda: np.asarray(img.convert("L")))
+
+    def crop(g):
+        box = _crop_box(_ink_mask(g), int(opts["crop_margin"]))
+        return g if box is None else g[box[1]:box[3], box[0]:box[2]]
+
+    if steps["crop"]:
+        gray = timed("crop", lambda: crop(gray))
+
+    if steps["deskew"]:
+        def deskew():
+            angle = _skew_angle(_ink_mask(gray), float(opts["deskew_max_angle"]), float(opts["deskew_step"]))
+            if angle == 0.0:
+                return gray
+            rotated = np.asarray(Image.fromarray(gray).rotate(angle, expand=True, fillcolor=255))
+            # trim the white wedges added by the rotation
+            return crop(rotated) if steps["crop"] else rotated
+        gray = timed("deskew", deskew)
+
+    if steps["downscale"]:
+        def downscale():
+            height = _char_height(_ink_mask(gray))
+            target = float(opts["target_char_height"])
+            if not height or height <= target * 1.2:
+                return gray
+            scale = target / height
+            h, w = gray.shape
+            small = Image.fromarray(gray).resize((max(1, int(w * scale)), max(1, int(h * scale))), Image.LANCZOS)
+            return np.asarray(small)
+        gray = timed("downscale", downscale)
+
+    if steps["binarize"]:
+        gray = timed("binarize", lambda: _binarize(gray, int(opts["binarize_window"]) | 1,
+                                                   float(opts["binarize_k"])))
+
+    with _preprocess_lock:
+        for name, secs in timings.items():
+            _preprocess_totals[name] += secs
+            _preprocess_counts[name] += 1
+    return Image.fromarray(gray), timings
+
+
+def preprocess_stats():
+    """Cumulative {step: {"calls", "total_s", "mean_ms"}} for this process."""
+    with _preprocess_lock:
+        return {
+            name: {
+                "calls": _preprocess_counts[name],
+                "total_s": round(total, 4),
+                "mean_ms": round(1000 * total / _preprocess_counts[name], 2),
+            }
+            for name, total in _preprocess_totals.items()
+        }
 
 
 # -----------------------------------------------------
 # OCR Functions
 # -----------------------------------------------------
-def ocr_from_pdf(pdf_path):
+def _ocr_image(img, page_timeout=0, preprocess=None):
+    _ensure_ocr()
+    if PREPROCESS_ENABLED if preprocess is None else preprocess:
+        img, _ = preprocess_image(img)
+    if OCR_POOL_ENABLED:
+        pool = get_ocr_pool(OCR_POOL_SIZE, OCR_LANG, pytesseract.pytesseract.tesseract_cmd)
+        return pool.ocr(img, timeout=page_timeout or None)
+    return pytesseract.image_to_string(img, lang=OCR_LANG, timeout=page_timeout or 0)
+
+
+def ocr_pool_stats():
+    """Stats of the warm OCR pool, or None when it is disabled."""
+    if not OCR_POOL_ENABLED:
+        return None
+    return get_ocr_pool(OCR_POOL_SIZE, OCR_LANG, pytesseract.pytesseract.tesseract_cmd).stats()
+
+
+def _ocr_pdf_page(pdf_path, page_no, page_timeout):
+    """Process-pool worker: rasterize and OCR a single PDF page."""
+    images = convert_from_path(pdf_path, dpi=OCR_DPI, first_page=page_no, last_page=page_no)
+    try:
+        return _ocr_image(images[0], page_timeout)
+    finally:
+        for img in images:
+            img.close()
+
+
+def _pdf_page_count(pdf_path):
+    return int(pdfinfo_from_path(pdf_path)["Pages"])
+
+
+def extract_text_layer(pdf_path):
+    """
+    Return the embedded text of each PDF page (list in page order) using
+    poppler's pdftotext, or None when it is unavailable or fails.
+    """
+    try:
+        out = subprocess.run(
+            ["pdftotext", "-layout", "-enc", "UTF-8", str(pdf_path), "-"],
+            capture_output=True, timeout=60, check=True,
+        )
+    except (OSError, subprocess.SubprocessError):
+        return None
+    # pdftotext terminates every page (including empty ones) with a form feed
+    pages = out.stdout.decode("utf-8", errors="replace").split("\f")
+    if pages and pages[-1].strip() == "":
+        pages.pop()
+    return pages
+
+
+def _has_text_layer(text):
+    return sum(ch.isalnum() for ch in text) >= TEXT_LAYER_MIN_CHARS
+
+
+def _windows(page_nos, window):
+    """Split ascending page numbers into runs of consecutive pages, at most window long."""
+    run = []
+    for n in page_nos:
+        if run and (n != run[-1] + 1 or len(run) == window):
+            yield run
+            run = []
+        run.append(n)
+    if run:
+        yield run
+
+
+def _iter_serial(pdf_path, page_nos, page_timeout, window):
+    for run in _windows(page_nos, window):
+        images = convert_from_path(pdf_path, dpi=OCR_DPI, first_page=run[0], last_page=run[-1])
+        try:
+            for page_no, img in zip(run, images):
+                try:
+                    text = _ocr_image(img, page_timeout)
+                except Exception as e:
+                    raise OcrPageError(page_no, e) from e
+                img.close()
+                yield page_no, text
+        finally:
+            for img in images:
+                img.close()
+            del images
+
+
+def _iter_parallel(pdf_path, page_nos, page_timeout, workers):
+    # Each task rasterizes its own page, and at most 2 * workers tasks are in
+    # flight, so memory stays bounded however long the PDF is.
+    pool = concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+    pending = {}
+    to_submit = iter(page_nos)
+    try:
+        for page_no in page_nos:
+            while len(pending) < 2 * workers:
+                n = next(to_submit, None)
+                if n is None:
+                    break
+                pending[n] = pool.submit(_ocr_pdf_page, pdf_path, n, page_timeout)
+            fut = pending.pop(page_no)
+            try:
+                # the worker enforces page_timeout on Tesseract itself; this is a
+                # backstop for pages stuck in rasterization
+                text = fut.result(timeout=page_timeout * 2 if page_timeout else None)
+            except concurrent.futures.TimeoutError as e:
+                raise OcrPageError(page_no, f"timed out after {page_timeout}s") from e
+            except Exception as e:
+                raise OcrPageError(page_no, e) from e
+            yield page_no, text
+    finally:
+        for fut in pending.values():
+            fut.cancel()
+        pool.shutdown(wait=False)
+
+
+def _iter_pooled(pdf_path, page_nos, page_timeout, window):
+    # Pages are rasterized here a window at a time and OCR'd concurrently by
+    # the warm worker pool; the threads only wait on the pool's pipes.
+    window = max(window, OCR_POOL_SIZE)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=OCR_POOL_SIZE) as threads:
+        for run in _windows(page_nos, window):
+            images = convert_from_path(pdf_path, dpi=OCR_DPI, first_page=run[0], last_page=run[-1])
+            try:
+                futures = [threads.submit(_ocr_image, img, page_timeout) for img in images]
+                for page_no, fut in zip(run, futures):
+                    try:
+                        text = fut.result()
+                    except Exception as e:
+                        raise OcrPageError(page_no, e) from e
+                    yield page_no, text
+            finally:
+                for img in images:
+                    img.close()
+                del images
+
+
+def iter_pdf_page_results(pdf_path, workers=None, page_timeout=None, window=None, use_text_layer=None):
+    """
+    Yield (page_no, text, source) for each page of a PDF, in page order.
+    source is "text" when the page's embedded text layer was usable and "ocr"
+    when it had to be rasterized and OCR'd. Pages are rasterized in windows of
+    OCR_PAGE_WINDOW (or one per pool task when workers > 1) and each image is
+    released once its text is captured, so peak memory does not grow with the
+    page count.
+    """
     _ensure_pdf()
-    pages = convert_from_path(pdf_path, dpi=200)
-    text = []
-    for p in pages:
+    workers = OCR_WORKERS if workers is None else int(workers)
+    page_timeout = OCR_PAGE_TIMEOUT if page_timeout is None else page_timeout
+    window = max(1, OCR_PAGE_WINDOW if window is None else int(window))
+    use_text_layer = TEXT_LAYER_ENABLED if use_text_layer is None else use_text_layer
+
+    n_pages = _pdf_page_count(pdf_path)
+    layer = extract_text_layer(pdf_path) if use_text_layer else None
+    if layer is not None and len(layer) != n_pages:
+        layer = None
+    ocr_pages = [n for n in range(1, n_pages + 1)
+                 if layer is None or not _has_text_layer(layer[n - 1])]
+
+    ocr_results = iter(())
+    if ocr_pages:
         _ensure_ocr()
-        text.append(pytesseract.image_to_string(p))
-    return "\n".join(text)
+        if OCR_POOL_ENABLED:
+            ocr_results = _iter_pooled(pdf_path, ocr_pages, page_timeout, window)
+        elif workers <= 1 or len(ocr_pages) <= 1:
+            ocr_results = _iter_serial(pdf_path, ocr_pages, page_timeout, window)
+        else:
+            ocr_results = _iter_parallel(pdf_path, ocr_pages, page_timeout, min(workers, len(ocr_pages)))
+
+    ocr_set = set(ocr_pages)
+    for page_no in range(1, n_pages + 1):
+        if page_no in ocr_set:
+            _, text = next(ocr_results)
+            yield page_no, text, "ocr"
+        else:
+            yield page_no, layer[page_no - 1], "text"
+
+
+def iter_pdf_pages(pdf_path, workers=None, page_timeout=None, window=None):
+    """Yield (page_no, text) for each page of a PDF; see iter_pdf_page_results()."""
+    for page_no, text, _ in iter_pdf_page_results(pdf_path, workers, page_timeout, window):
+        yield page_no, text
+
+
+def ocr_from_pdf(pdf_path, workers=None, page_timeout=None):
+    """
+    OCR every page of a PDF and return the text joined in page order.
+    workers > 1 OCRs pages concurrently in a process pool; workers=1 keeps
+    the serial path. Raises OcrPageError naming the page that failed.
+    """
+    return "\n".join(text for _, text in iter_pdf_pages(pdf_path, workers, page_timeout))
 
 
 def ocr_from_image(img_path):
     _ensure_ocr()
     img = Image.open(img_path)
-    return pytesseract.image_to_string(img)
+    return _ocr_image(img, OCR_PAGE_TIMEOUT)
+
+
+def ocr_file(path, use_cache=True, on_page=None, workers=None, digest=None):
+    """
+    OCR a single PDF or image and extract its fields.
+    Returns (text, fields, pages) where pages lists {"page", "source"} for
+    each page. Repeated calls for the same file bytes and OCR settings are
+    served from OCR_CACHE without touching Tesseract. on_page, if given, is
+    called once per finished page; digest is the file's SHA-256 if the
+    caller already has it.
+    """
+    p = Path(path)
+    on_page = on_page or (lambda: None)
+    key = OCR_CACHE.key_for(p, digest=digest) if use_cache else None
+    if key is not None:
+        entry = OCR_CACHE.get(key)
+        if entry is not None:
+            for _ in entry["pages"]:
+                on_page()
+            return entry["text"], {**entry["fields"], "raw_text": entry["text"]}, entry["pages"]
+
+    if p.suffix.lower() == ".pdf":
+        if not PDF_SUPPORT:
+            raise RuntimeError(f"Cannot process PDF files: {OCR_MISSING_MSG}")
+        texts = []
+        pages = []
+        for page_no, text, source in iter_pdf_page_results(str(p), workers=workers):
+            texts.append(text)
+            pages.append({"page": page_no, "source": source})
+            on_page()
+        txt = "\n".join(texts)
+    elif p.suffix.lower() in IMAGE_SUFFIXES:
+        txt = ocr_from_image(str(p))
+        pages = [{"page": 1, "source": "ocr"}]
+        on_page()
+    else:
+        raise ValueError(f"Unsupported file type: {p.suffix}")
+
+    fields = extract_fields_from_text(txt)
+    if key is not None:
+        OCR_CACHE.put(key, {
+            "text": txt,
+            "fields": {k: v for k, v in fields.items() if k != "raw_text"},
+            "pages": pages,
+            "source_file": p.name,
+            "created_at": now_iso(),
+        })
+    return txt, fields, pages
 
 
 # -----------------------------------------------------
 # Field Extraction (regex)
 # -----------------------------------------------------
+# Patterns are compiled once at import. Every labelled pattern starts with one
+# of its trigger words, so a field can only match from the first line that
+# contains a trigger; searching the full text from that line's offset gives
+# the same first match as re.search() over the whole text.
+FieldRule = namedtuple("FieldRule", ["field", "triggers", "pattern", "group", "convert"])
+FieldMatch = namedtuple("FieldMatch", ["value", "confidence", "span"])
+
+
+def _to_float(s):
+    return float(s.replace(",", ""))
+
+
+FIELD_RULES = [
+    FieldRule("extracted_name", ("Name",),
+              re.compile(r"Name[:\s]+([A-Z][A-Za-z \.\-]{2,80})"), 1, str.strip),
+    FieldRule("extracted_dob", ("dob", "date of birth"),
+              re.compile(r"(DOB|Date of Birth)[:\s]*([0-9]{4}-[0-9]{2}-[0-9]{2}|[0-9]{2}/[0-9]{2}/[0-9]{4})", re.IGNORECASE), 2, str.strip),
+    FieldRule("extracted_college", ("college",),
+              re.compile(r"College[:\s]*([A-Za-z0-9 &\.-]+)", re.IGNORECASE), 1, str.strip),
+    FieldRule("extracted_course", ("course",),
+              re.compile(r"Course[:\s]*([A-Za-z0-9 \-&]+)", re.IGNORECASE), 1, str.strip),
+    FieldRule("extracted_gpa", ("gpa",),
+              re.compile(r"(GPA|CGPA)[:\s]*([0-9]{1,2}\.?[0-9]{0,2})", re.IGNORECASE), 2, float),
+    FieldRule("extracted_usn", ("usn", "roll no"),
+              re.compile(r"(USN|Roll No\.?|usn)[:\s]*([A-Z0-9\-]+)", re.IGNORECASE), 2, str.strip),
+    FieldRule("extracted_income", ("income",),
+              re.compile(r"(Income|Family Income|family_income)[:\s₹Rs\.]*([0-9,]+)", re.IGNORECASE), 2, _to_float),
+    FieldRule("extracted_admission_year", ("admission",),
+              re.compile(r"Admission\s*Year[:\s]*([0-9]{4})", re.IGNORECASE), 1, int),
+    FieldRule("extracted_loan_amount", ("loan_amount", "loan amount"),
+              re.compile(r"(loan_amount|Loan amount|Loan Amount)[:\s₹Rs\.]*([0-9,]+)", re.IGNORECASE), 2, _to_float),
+]
+
+# Trigger words use the same case rules as their pattern, so the line filter
+# never disagrees with re's own case folding. _ANY_TRIGGER finds the next line
+# worth looking at, so lines without any label are skipped inside the regex
+# engine instead of in Python.
+def _trigger_alternation(rule):
+    words = "|".join(re.escape(t) for t in rule.triggers)
+    return f"(?i:{words})" if rule.pattern.flags & re.IGNORECASE else f"(?:{words})"
+
+
+_TRIGGERS = {rule.field: re.compile(_trigger_alternation(rule)) for rule in FIELD_RULES}
+_ANY_TRIGGER = re.compile("|".join(_trigger_alternation(rule) for rule in FIELD_RULES))
+
+# Unlabelled fallback for the name: the first line that is only a capitalised
+# run of letters. Only consulted when no "Name:" label matched.
+NAME_LINE_RE = re.compile(r"^\s*([A-Z][A-Za-z ]{2,80})\s*$", re.MULTILINE)
+
+LABELLED_CONFIDENCE = 0.9
+FALLBACK_NAME_CONFIDENCE = 0.4
+OUT_OF_RANGE_CONFIDENCE = 0.5
+
+
+def _confidence(field, value):
+    if field == "extracted_gpa" and not 0 <= value <= 10:
+        return OUT_OF_RANGE_CONFIDENCE
+    if field == "extracted_admission_year" and not 1950 <= value <= 2100:
+        return OUT_OF_RANGE_CONFIDENCE
+    return LABELLED_CONFIDENCE
+
+
+def extract_field_matches(text):
+    """
+    Extract every field in a single line-oriented pass over the text.
+    Returns {field: FieldMatch(value, confidence, span) or None}, where span
+    is the (start, end) offset of the matched value in text.
+    """
+    results = {rule.field: None for rule in FIELD_RULES}
+    pending = list(FIELD_RULES)
+
+    pos = 0
+    while pending:
+        hit = _ANY_TRIGGER.search(text, pos)
+        if not hit:
+            break
+        line_start = text.rfind("\n", 0, hit.start()) + 1
+        line_end = text.find("\n", hit.start())
+        if line_end == -1:
+            line_end = len(text)
+        line = text[line_start:line_end]
+        for rule in list(pending):
+            if not _TRIGGERS[rule.field].search(line):
+                continue
+            # first line carrying a trigger: the search from here is final
+            pending.remove(rule)
+            m = rule.pattern.search(text, line_start)
+            if not m:
+                continue
+            try:
+                value = rule.convert(m.group(rule.group))
+            except ValueError:
+                continue
+            results[rule.field] = FieldMatch(value, _confidence(rule.field, value), m.span(rule.group))
+        pos = line_end + 1
+
+    if results["extracted_name"] is None:
+        m = NAME_LINE_RE.search(text)
+        if m:
+            results["extracted_name"] = FieldMatch(m.group(1).strip(), FALLBACK_NAME_CONFIDENCE, m.span(1))
+    return results
+
+
 def extract_fields_from_text(text):
     """Extract structured info from OCR text."""
-    name = None
-    dob = None
-    college = None
-    course = None
-    gpa = None
-    usn = None
-    income = None
-    admission_year = None
-    loan_amount = None
-
-    # Name
-    m = re.search(r"Name[:\s]+([A-Z][A-Za-z \.\-]{2,80})", text)
-    if m:
-        name = m.group(1).strip()
-    else:
-        m2 = re.search(r"^\s*([A-Z][A-Za-z ]{2,80})\s*$", text, re.MULTILINE)
-        if m2:
-            name = m2.group(1).strip()
+    matches = extract_field_matches(text)
+    fields = {field: (m.value if m else None) for field, m in matches.items()}
+    return dict(
+        extracted_name=fields["extracted_name"],
+        extracted_dob=fields["extracted_dob"],
+        extracted_college=fields["extracted_college"],
+        extracted_course=fields["extracted_course"],
+        extracted_gpa=fields["extracted_gpa"],
+        extracted_usn=fields["extracted_usn"],
+        extracted_income=fields["extracted_income"],
+        extracted_admission_year=fields["extracted_admission_year"],
+        extracted_loan_amount=fields["extracted_loan_amount"],
+        raw_text=text
+    )
 
-    # GPA / CGPA
-    m = re.search(r"(GPA|CGPA)[:\s]*([0-9]{1,2}\.?[0-9]{0,2})", text, re.IGNORECASE)
-    if m:
-        try:
-            gpa = float(m.group(2))
-        except:
-            gpa = None
 
-    # Income
-    m = re.search(r"(Income|Family Income|family_income)[:\s₹Rs\.]*([0-9,]+)", text, re.IGNORECASE)
-    if m:
-        try:
-            income = float(m.group(2).replace(",", ""))
-        except:
-            income = None
+# Whole-column equivalents of the FieldRule converters, for batch re-extraction.
+_FRAME_CONVERTERS = {
+    str.strip: lambda s: s.str.strip(),
+    float: lambda s: pd.to_numeric(s, errors="coerce"),
+    _to_float: lambda s: pd.to_numeric(s.str.replace(",", "", regex=False), errors="coerce"),
+    int: lambda s: pd.to_numeric(s, errors="coerce").astype("Int64"),
+}
 
-    # Admission Year
-    m = re.search(r"Admission\s*Year[:\s]*([0-9]{4})", text, re.IGNORECASE)
-    if m:
-        try:
-            admission_year = int(m.group(1))
-        except:
-            admission_year = None
-
-    # Course
-    m = re.search(r"Course[:\s]*([A-Za-z0-9 \-&]+)", text, re.IGNORECASE)
-    if m:
-        course = m.group(1).strip()
-
-    # College
-    m = re.search(r"College[:\s]*([A-Za-z0-9 &\.-]+)", text, re.IGNORECASE)
-    if m:
-        college = m.group(1).strip()
-
-    # USN
-    m = re.search(r"(USN|Roll No\.?|usn)[:\s]*([A-Z0-9\-]+)", text, re.IGNORECASE)
-    if m:
-        usn = m.group(2).strip()
-
-    # DOB
-    m = re.search(r"(DOB|Date of Birth)[:\s]*([0-9]{4}-[0-9]{2}-[0-9]{2}|[0-9]{2}/[0-9]{2}/[0-9]{4})", text, re.IGNORECASE)
-    if m:
-        dob = m.group(2).strip()
-
-    # Loan amount
-    m = re.search(r"(loan_amount|Loan amount|Loan Amount)[:\s₹Rs\.]*([0-9,]+)", text, re.IGNORECASE)
-    if m:
-        try:
-            loan_amount = float(m.group(2).replace(",", ""))
-        except:
-            loan_amount = None
 
-    return dict(
-        extracted_name=name,
-        extracted_dob=dob,
-        extracted_college=college,
-        extracted_course=course,
-        extracted_gpa=gpa,
-        extracted_usn=usn,
-        extracted_income=income,
-        extracted_admission_year=admission_year,
-        extracted_loan_amount=loan_amount,
-        raw_text=text
-    )
+def extract_fields_frame(texts):
+    """
+    Vectorized extract_fields_from_text() over a Series of texts.
+    Returns a DataFrame with one column per FIELD_RULES field, aligned with
+    texts' index; fields that did not match are missing (NaN/<NA>).
+    """
+    out = {}
+    for rule in FIELD_RULES:
+        raw = texts.str.extract(rule.pattern, expand=True)[rule.group - 1]
+        col = _FRAME_CONVERTERS[rule.convert](raw)
+        if rule.field == "extracted_name":
+            fallback = texts.str.extract(NAME_LINE_RE, expand=True)[0].str.strip()
+            col = col.where(col.notna(), fallback)
+        out[rule.field] = col
+    return pd.DataFrame(out, index=texts.index)
 
 
 # -----------------------------------------------------
 # Main Upload Handler (fixed)
 # -----------------------------------------------------
-def process_upload(user_email, file_paths: list):
+def _count_pages(file_paths):
+    total = 0
+    for p in file_paths:
+        try:
+            total += _pdf_page_count(str(p)) if Path(p).suffix.lower() == ".pdf" else 1
+        except Exception:
+            total += 1
+    return total
+
+
+def process_upload(user_email, file_paths: list, progress=None):
     """
     Process uploaded documents (PDF or image) for OCR + extraction.
     user_email: string identifier for user
     file_paths: list of file paths
+    progress: optional callable(pages_done, pages_total) called per page
     """
     all_text = []
+    page_sources = []
+    fields = None
+    pages_total = _count_pages(file_paths) if progress is not None else 0
+    pages_done = 0
+
+    def page_done():
+        nonlocal pages_done
+        pages_done += 1
+        progress(pages_done, max(pages_total, pages_done))
+
+    on_page = page_done if progress is not None else None
+
+    hashes = []
     for p in file_paths:
         p = Path(p)
         try:
-            if p.suffix.lower() == ".pdf":
-                if not PDF_SUPPORT:
-                    raise RuntimeError(f"Cannot process PDF files: {OCR_MISSING_MSG}")
-                txt = ocr_from_pdf(str(p))
-            elif p.suffix.lower() in ('.png', '.jpg', '.jpeg', '.tiff', '.bmp', '.gif'):
-                txt = ocr_from_image(str(p))
-            else:
-                raise ValueError(f"Unsupported file type: {p.suffix}")
+            digest = file_sha256(p)
+            txt, fields, pages = ocr_file(p, on_page=on_page, digest=digest)
         except Exception as e:
             raise RuntimeError(f"OCR failed for file {p}: {e}")
         all_text.append(txt)
+        hashes.append(digest)
+        page_sources.extend({"file": str(p), **pg} for pg in pages)
 
     joined = "\n".join(all_text)
-    fields = extract_fields_from_text(joined)
-    parsed_json = json.dumps(fields, ensure_ascii=False)
+    if len(all_text) != 1:
+        # cached fields are per file; multi-file uploads extract from the joined text
+        fields = extract_fields_from_text(joined)
+
+    doc_row = build_doc_row(next_doc_id(), user_email, file_paths, fields, page_sources, hashes)
+    _append_doc(doc_row)
+    return doc_row
 
-    df = _load_docs()
-    new_id = int(df['doc_id'].max()) + 1 if len(df) > 0 and pd.notna(df['doc_id'].max()) else 1
 
-    doc_row = {
-        "doc_id": new_id,
+def build_doc_row(doc_id, user_email, file_paths, fields, page_sources, source_hashes):
+    """
+    Assemble a documents.csv row from extraction results. raw_text and the
+    parsed_json copy go to the blob store; the row keeps their keys.
+    """
+    return {
+        "doc_id": doc_id,
         "email": str(user_email).strip(),  # ✅ fixed: store email string
         "upload_time": now_iso(),
         "source_files": json.dumps([str(x) for x in file_paths]),
-        **fields,
-        "parsed_json": parsed_json
+        **{k: v for k, v in fields.items() if k != "raw_text"},
+        "raw_text_blob": blobstore.put_text(fields.get("raw_text") or ""),
+        "parsed_json_blob": blobstore.put_text(json.dumps(fields, ensure_ascii=False)),
+        "page_sources": json.dumps(page_sources),
+        "source_hashes": json.dumps(list(source_hashes)),
     }
-
-    _append_doc(doc_row)
-    return doc_row
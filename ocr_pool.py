@@ -0,0 +1,245 @@
+# ocr_pool.py
+"""
+Long-lived pool of warm OCR worker processes.
+
+Workers serve page images sent over a multiprocessing pipe. The speed-up
+needs the optional `tesserocr` binding (not in requirements.txt, as it
+needs the Tesseract headers to build): each worker then loads the engine
+and language data once, and a page costs one round-trip instead of a
+tesseract process start, a temp file and a language-data load.
+
+Without tesserocr -- the default install -- there is no per-page saving:
+workers pipe each image through `tesseract stdin stdout`, which still
+starts one tesseract process and loads the language data per page, just as
+pytesseract does; only the temp files are avoided. get_ocr_pool() warns
+once when it starts in that mode.
+
+Workers are health-checked periodically and restarted automatically when
+they die, hang past a request timeout, or fail a ping.
+"""
+import atexit
+import importlib.util
+import io
+import multiprocessing as mp
+import os
+import queue
+import subprocess
+import threading
+import warnings
+
+from PIL import Image
+
+TESSEROCR_SUPPORT = importlib.util.find_spec("tesserocr") is not None
+HEALTH_INTERVAL = float(os.environ.get("OCR_POOL_HEALTH_INTERVAL", 30))
+PING_TIMEOUT = 5.0
+
+
+# -----------------------------------------------------
+# Worker side
+# -----------------------------------------------------
+class _TesserocrEngine:
+    name = "tesserocr"
+
+    def __init__(self, lang):
+        import tesserocr
+        self.api = tesserocr.PyTessBaseAPI(lang=lang)
+
+    def ocr(self, img):
+        self.api.SetImage(img)
+        return self.api.GetUTF8Text()
+
+
+class _CliEngine:
+    name = "tesseract-cli"
+
+    def __init__(self, lang, cmd):
+        self.lang = lang
+        self.cmd = cmd
+
+    def ocr(self, img):
+        buf = io.BytesIO()
+        img.save(buf, format="PNG")
+        out = subprocess.run([self.cmd, "stdin", "stdout", "-l", self.lang],
+                             input=buf.getvalue(), capture_output=True, check=True)
+        return out.stdout.decode("utf-8", errors="replace")
+
+
+def _worker_main(conn, lang, tesseract_cmd):
+    engine = _TesserocrEngine(lang) if TESSEROCR_SUPPORT else _CliEngine(lang, tesseract_cmd)
+    while True:
+        try:
+            msg = conn.recv()
+        except (EOFError, OSError):
+            break
+        if msg[0] == "stop":
+            break
+        if msg[0] == "ping":
+            conn.send(("pong", engine.name))
+            continue
+        _, mode, size, data = msg
+        try:
+            conn.send(("ok", engine.ocr(Image.frombytes(mode, size, data))))
+        except Exception as e:
+            conn.send(("err", f"{type(e).__name__}: {e}"))
+
+
+# -----------------------------------------------------
+# Pool
+# -----------------------------------------------------
+class _Worker:
+    def __init__(self, slot, proc, conn):
+        self.slot = slot
+        self.proc = proc
+        self.conn = conn
+
+
+class OcrWorkerPool:
+    """Fixed-size pool of warm OCR processes; ocr() is safe to call from many threads."""
+
+    def __init__(self, size, lang, tesseract_cmd="tesseract", health_interval=HEALTH_INTERVAL):
+        self.size = max(1, int(size))
+        self.lang = lang
+        self.tesseract_cmd = tesseract_cmd
+        self.requests = 0
+        self.failures = 0
+        self.restarts = 0
+        self._ctx = mp.get_context("spawn")
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self._idle = queue.Queue()
+        for slot in range(self.size):
+            self._idle.put(self._spawn(slot))
+        self._monitor = threading.Thread(target=self._monitor_loop, args=(health_interval,),
+                                         name="ocr-pool-health", daemon=True)
+        self._monitor.start()
+
+    def _spawn(self, slot):
+        parent_conn, child_conn = self._ctx.Pipe()
+        proc = self._ctx.Process(target=_worker_main, args=(child_conn, self.lang, self.tesseract_cmd),
+                                 name=f"ocr-worker-{slot}", daemon=True)
+        proc.start()
+        child_conn.close()
+        return _Worker(slot, proc, parent_conn)
+
+    def _restart(self, worker):
+        try:
+            worker.conn.close()
+        except OSError:
+            pass
+        if worker.proc.is_alive():
+            worker.proc.kill()
+        worker.proc.join(timeout=1)
+        with self._lock:
+            self.restarts += 1
+        return self._spawn(worker.slot)
+
+    def ocr(self, img, timeout=None):
+        """OCR a PIL image in a pool worker and return its text."""
+        if self._closed.is_set():
+            raise RuntimeError("OCR pool is shut down")
+        if img.mode not in ("L", "RGB"):
+            img = img.convert("RGB")
+        worker = self._idle.get()
+        try:
+            if not worker.proc.is_alive():
+                worker = self._restart(worker)
+            with self._lock:
+                self.requests += 1
+            worker.conn.send(("ocr", img.mode, img.size, img.tobytes()))
+            if not worker.conn.poll(timeout):
+                raise TimeoutError(f"no result after {timeout}s")
+            kind, payload = worker.conn.recv()
+        except (TimeoutError, EOFError, OSError) as e:
+            with self._lock:
+                self.failures += 1
+            worker = self._restart(worker)
+            raise RuntimeError(f"OCR worker {worker.slot} failed: {e}") from e
+        finally:
+            self._idle.put(worker)
+        if kind == "err":
+            with self._lock:
+                self.failures += 1
+            raise RuntimeError(payload)
+        return payload
+
+    def health_check(self, timeout=PING_TIMEOUT):
+        """Ping every idle worker, restarting any that are dead or unresponsive."""
+        checked = {}
+        for _ in range(self.size):
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                break  # the rest are busy serving requests
+            try:
+                ok = worker.proc.is_alive()
+                if ok:
+                    worker.conn.send(("ping",))
+                    ok = worker.conn.poll(timeout) and worker.conn.recv()[0] == "pong"
+            except (EOFError, OSError):
+                ok = False
+            if not ok:
+                worker = self._restart(worker)
+            checked[worker.slot] = "ok" if ok else "restarted"
+            self._idle.put(worker)
+        return checked
+
+    def _monitor_loop(self, interval):
+        while not self._closed.wait(interval):
+            self.health_check()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": self.size,
+                "engine": "tesserocr" if TESSEROCR_SUPPORT else "tesseract-cli",
+                "idle": self._idle.qsize(),
+                "requests": self.requests,
+                "failures": self.failures,
+                "restarts": self.restarts,
+            }
+
+    def shutdown(self):
+        self._closed.set()
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                worker.conn.send(("stop",))
+            except OSError:
+                pass
+            worker.proc.join(timeout=1)
+            if worker.proc.is_alive():
+                worker.proc.kill()
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def get_ocr_pool(size, lang, tesseract_cmd="tesseract"):
+    """Return this process's pool, starting it on first use."""
+    global _pool, _pool_pid
+    with _pool_lock:
+        # a forked child must not reuse the parent's pipes
+        if _pool is None or _pool_pid != os.getpid():
+            if not TESSEROCR_SUPPORT:
+                warnings.warn("OCR pool: tesserocr is not installed, so workers start a tesseract "
+                              "process per page; pip install tesserocr to keep the engine loaded",
+                              RuntimeWarning, stacklevel=2)
+            _pool = OcrWorkerPool(size, lang, tesseract_cmd)
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def shutdown_ocr_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None and _pool_pid == os.getpid():
+            _pool.shutdown()
+        _pool = None
+
+
+atexit.register(shutdown_ocr_pool)
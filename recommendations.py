@@ -0,0 +1,298 @@
+# recommendations.py
+"""
+Precomputed bank recommendations per user.
+
+Every user with documents gets a small cache entry under
+data/recommendations/ holding their scoring profile (the newest non-empty
+value of each PROFILE_FIELDS field across their documents) and, per bank,
+the score and explanation of bank_matching together with the bank's
+version stamp (a hash of its banks.csv row, see bank_catalog). The
+Recommendations page renders straight from it.
+
+* A stored document (ocr_pipeline.append_docs) updates the profile of its
+  user and rescores that user against every bank. Bulk loads (backfill.py)
+  skip this per batch and call rebuild_users() once at the end.
+* A changed banks.csv is picked up bank by bank: only banks whose version
+  stamp differs from the entry's are rescored (new banks are added, removed
+  ones dropped). for_user() does this lazily for one user; after editing
+  banks.csv, `python recommendations.py` sweeps every entry eagerly.
+* Every entry is stamped with SCORER_VERSION and the hash of the active
+  bank_rules rule set, so editing data/bank_rules.json rebuilds all entries
+  on their next read or sweep; bump SCORER_VERSION for other scoring
+  changes.
+
+    python recommendations.py [--rebuild]
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import pandas as pd
+
+import bank_matching
+from bank_rules import catalog_rules, rules_version
+from utils import match_file_mode
+
+RECO_DIR = Path("data") / "recommendations"
+SCORER_VERSION = 1
+PROFILE_FIELDS = ("extracted_gpa", "extracted_income", "extracted_loan_amount")
+
+_lock = threading.RLock()
+
+
+# -----------------------------------------------------
+# Entries
+# -----------------------------------------------------
+def _entry_path(user):
+    digest = hashlib.sha1(str(user).encode("utf-8")).hexdigest()
+    return RECO_DIR / digest[:2] / f"{digest}.json"
+
+
+def _load(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _save(entry):
+    path = _entry_path(entry["user"])
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f"{path.name}.", suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(entry, f, ensure_ascii=False)
+    match_file_mode(tmp, path)
+    os.replace(tmp, path)
+
+
+def _drop(user):
+    try:
+        os.remove(_entry_path(user))
+    except FileNotFoundError:
+        pass
+
+
+def _present(v):
+    return v is not None and not (isinstance(v, float) and pd.isna(v)) and v != ""
+
+
+def _number(v):
+    try:
+        return float(v)
+    except (TypeError, ValueError):
+        return str(v)  # kept as text: scored as a parse error, as compute_approval() would
+
+
+def _doc_user(row):
+    email = row.get("email")
+    if _present(email):
+        return str(email)
+    uid = row.get("user_id")
+    return str(int(float(uid))) if _present(uid) else None
+
+
+# -----------------------------------------------------
+# Scoring
+# -----------------------------------------------------
+def _scorer():
+    return f"{SCORER_VERSION}:{rules_version()}"
+
+
+def _score(entry, banks, versions, rules, bank_ids=None):
+    """
+    Rescore entry against bank_ids (all banks when None) and stamp each with
+    its version. rules is the CompiledRules of banks; the whole catalog is
+    scored in one pass and only bank_ids are explained and stored.
+    """
+    if banks.empty or bank_ids is not None and not bank_ids:
+        return
+    result = bank_matching.score_banks(entry["profile"], banks, rules)
+    for i, bid in enumerate(banks["bank_id"].astype(int).tolist()):
+        if bank_ids is not None and bid not in bank_ids:
+            continue
+        entry["banks"][str(bid)] = {
+            "version": versions.get(bid),
+            "score": int(result.score[i]),
+            "why": result.explain(i),
+        }
+
+
+def _bring_up_to_date(entry, banks, versions, rules):
+    """Rescore only the banks whose version changed; returns the number of banks touched."""
+    current = {str(bid): v for bid, v in versions.items()}
+    stale = {int(bid) for bid, v in current.items() if entry["banks"].get(bid, {}).get("version") != v}
+    removed = [bid for bid in entry["banks"] if bid not in current]
+    for bid in removed:
+        del entry["banks"][bid]
+    _score(entry, banks, versions, rules, stale)
+    return len(stale) + len(removed)
+
+
+def _new_entry(user, profile, doc_id=None):
+    return {
+        "user": user,
+        "scorer": _scorer(),
+        "profile": {f: profile.get(f) for f in PROFILE_FIELDS},
+        "profile_version": doc_id,
+        "banks": {},
+        "updated_at": None,
+    }
+
+
+def _profiles_from_documents(users=None):
+    """{user: profile} from the documents table (all users, or just `users`)."""
+    from eligibility import load_applicants  # eligibility imports ocr_pipeline, which imports this module
+    applicants = load_applicants(users)
+    out = {}
+    for rec in applicants.to_dict("records"):
+        out[rec["user"]] = {f: (None if pd.isna(rec[f]) else float(rec[f])) for f in PROFILE_FIELDS}
+    return out
+
+
+def _commit(entry, banks, versions, rules, full=False):
+    if full:
+        entry["banks"] = {}
+        _score(entry, banks, versions, rules)
+    else:
+        _bring_up_to_date(entry, banks, versions, rules)
+    entry["updated_at"] = time.time()
+    _save(entry)
+    return entry
+
+
+# -----------------------------------------------------
+# Public API
+# -----------------------------------------------------
+def record_documents(rows):
+    """
+    Fold newly stored document rows into their users' profiles and rescore
+    those users. Called by ocr_pipeline.append_docs() after the rows are
+    written. If an entry cannot be updated it is removed (the upload itself
+    still succeeds), so the next read rebuilds it from the documents table
+    instead of serving stale scores.
+    """
+    by_user = {}
+    for row in sorted(rows, key=lambda r: (r.get("doc_id") is None, r.get("doc_id") or 0)):
+        user = _doc_user(row)
+        if user is not None:
+            by_user.setdefault(user, []).append(row)
+    if not by_user:
+        return
+    with _lock:
+        banks, versions, rules = catalog_rules()
+        scorer = _scorer()
+        entries = {u: _load(_entry_path(u)) for u in by_user}
+        cold = [u for u, e in entries.items() if e is None or e.get("scorer") != scorer]
+        seeded = _profiles_from_documents(cold) if cold else {}
+        for user, docs in by_user.items():
+            try:
+                entry = entries[user]
+                if user in cold:
+                    # built from the table, which already holds these rows
+                    entry = _new_entry(user, seeded.get(user, {}))
+                    changed = True
+                else:
+                    before = dict(entry["profile"])
+                    for doc in docs:
+                        for f in PROFILE_FIELDS:
+                            if _present(doc.get(f)):
+                                entry["profile"][f] = _number(doc[f])
+                    changed = entry["profile"] != before
+                entry["profile_version"] = docs[-1].get("doc_id")
+                _commit(entry, banks, versions, rules, full=changed)
+            except Exception:
+                _drop(user)
+
+
+def for_user(user):
+    """
+    The user's banks ranked by score (ties keep catalog order), as
+    [{'bank_id', 'bank_name', 'score', 'why'}]. Banks changed since the
+    entry was stored are rescored first. An empty list means the user has
+    no extracted GPA or income to score yet.
+    """
+    if not user:
+        return []
+    with _lock:
+        banks, versions, rules = catalog_rules()
+        entry = _load(_entry_path(user))
+        if entry is None or entry.get("scorer") != _scorer():
+            # users without documents get an entry too, so they are not re-seeded on every rerun
+            profile = _profiles_from_documents([user]).get(user, {})
+            entry = _commit(_new_entry(user, profile), banks, versions, rules, full=True)
+        elif _bring_up_to_date(entry, banks, versions, rules):
+            entry["updated_at"] = time.time()
+            _save(entry)
+    if not any(_present(v) for v in entry["profile"].values()):
+        return []
+    position = {int(b): i for i, b in enumerate(banks["bank_id"])}
+    names = dict(zip(banks["bank_id"].astype(int), banks["bank_name"]))
+    rows = [{"bank_id": int(bid), "bank_name": names.get(int(bid)), "score": r["score"], "why": r["why"]}
+            for bid, r in entry["banks"].items()]
+    return sorted(rows, key=lambda r: (-r["score"], position.get(r["bank_id"], len(position))))
+
+
+def rebuild_users(users=None):
+    """
+    Recompute the entries of `users` (every user with documents when None)
+    from the documents table in one read of it; used after bulk loads that
+    skip record_documents(). Returns the number of entries written.
+    """
+    with _lock:
+        banks, versions, rules = catalog_rules()
+        profiles = _profiles_from_documents(users)
+        for user, profile in profiles.items():
+            _commit(_new_entry(user, profile), banks, versions, rules, full=True)
+        return len(profiles)
+
+
+def refresh_all(rebuild=False):
+    """
+    Bring every stored entry up to date with banks.csv, rescoring only the
+    banks that changed (rebuild=True recomputes every user from the
+    documents table instead). Returns (entries, bank scores recomputed).
+    """
+    with _lock:
+        if rebuild:
+            n = rebuild_users()
+            return n, n * len(catalog_rules()[1])
+        banks, versions, rules = catalog_rules()
+        entries = touched = 0
+        for path in RECO_DIR.glob("*/*.json"):
+            entry = _load(path)
+            if entry is None:
+                continue
+            entries += 1
+            if entry.get("scorer") != _scorer():
+                entry["scorer"] = _scorer()
+                _commit(entry, banks, versions, rules, full=True)
+                touched += len(versions)
+                continue
+            n = _bring_up_to_date(entry, banks, versions, rules)
+            if n:
+                entry["updated_at"] = time.time()
+                _save(entry)
+                touched += n
+        return entries, touched
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bring precomputed bank recommendations up to date.")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="recompute every user from the documents table instead of only changed banks")
+    args = parser.parse_args(argv)
+    t0 = time.perf_counter()
+    entries, touched = refresh_all(args.rebuild)
+    print(f"{entries} users, {touched} bank scores recomputed in {time.perf_counter() - t0:.2f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
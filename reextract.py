@@ -0,0 +1,183 @@
+# reextract.py
+"""
+Re-run field extraction over the raw_text already stored for each document,
+so regex improvements reach old uploads without re-OCR.
+
+    python reextract.py [--chunksize 5000] [--workers 1] [--dry-run]
+
+The table is streamed in chunks, each chunk is extracted column-wise with
+pandas str.extract (optionally across a process pool, a few chunks in flight
+at a time), and written to a temp file as soon as it is done; the temp file
+replaces documents.csv at the end, so memory holds a few chunks rather than
+the table. With FINBRIDGE_STORAGE=sqlite the documents table is read in
+chunks and changed fields are updated in place. The precomputed
+recommendations of users whose documents changed are rebuilt afterwards.
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+import blobstore
+import storage
+from utils import VersionConflict, file_version, iter_table_csv, match_file_mode, table_lock
+from ocr_pipeline import DOCS_CSV, FIELD_RULES, extract_fields_frame
+
+FIELDS = [rule.field for rule in FIELD_RULES]
+NUMERIC_FIELDS = {rule.field for rule in FIELD_RULES if rule.convert is not str.strip}
+
+
+def _as_column(values, field):
+    """Normalise a column so old and new values compare like for like."""
+    if field in NUMERIC_FIELDS:
+        return pd.to_numeric(values, errors="coerce").astype("float64")
+    return values.astype(object).where(values.notna(), None)
+
+
+def _parsed_json(row, fields, raw_text):
+    out = {}
+    for f in FIELDS:
+        v = row[f]
+        if v is None or (isinstance(v, float) and pd.isna(v)):
+            v = None
+        elif f == "extracted_admission_year":
+            v = int(v)
+        out[f] = v
+    out["raw_text"] = raw_text
+    return json.dumps(out, ensure_ascii=False)
+
+
+def _users(rows):
+    """Users owning rows, keyed as eligibility.load_applicants() keys them (email, else user_id)."""
+    user = rows["email"].astype(object).where(rows["email"].notna(), None)
+    if "user_id" in rows.columns:
+        legacy = user.isna() & rows["user_id"].notna()
+        user[legacy] = rows.loc[legacy, "user_id"].astype(str)
+    return set(user.dropna())
+
+
+def reextract_chunk(chunk):
+    """
+    Re-extract one chunk of documents. Returns (chunk, {field: rows changed},
+    users whose rows changed).
+    """
+    texts = blobstore.resolve_column(chunk, "raw_text")
+    has_text = texts.notna()
+    fresh = extract_fields_frame(texts[has_text].astype(str))
+
+    counts = {}
+    any_changed = pd.Series(False, index=chunk.index)
+    for field in FIELDS:
+        old = _as_column(chunk[field] if field in chunk.columns else pd.Series(None, index=chunk.index), field)
+        new = old.copy()
+        new[has_text] = _as_column(fresh[field], field)
+        same = (old == new) | (old.isna() & new.isna())
+        changed = ~same
+        counts[field] = int(changed.sum())
+        any_changed |= changed
+        chunk[field] = new
+
+    if any_changed.any():
+        if "parsed_json_blob" not in chunk.columns:
+            chunk["parsed_json_blob"] = None
+        chunk["parsed_json_blob"] = chunk["parsed_json_blob"].astype(object)
+        chunk.loc[any_changed, "parsed_json_blob"] = [
+            blobstore.put_text(_parsed_json(row, FIELDS, texts[i]))
+            for i, row in chunk.loc[any_changed].iterrows()
+        ]
+        if "parsed_json" in chunk.columns:
+            chunk.loc[any_changed, "parsed_json"] = None
+    return chunk, counts, _users(chunk.loc[any_changed])
+
+
+def _completed_chunks(reader, workers):
+    """reextract_chunk() of every chunk in table order, with at most 2 * workers chunks in flight."""
+    if workers <= 1:
+        yield from map(reextract_chunk, reader)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for chunk in reader:
+            pending.append(pool.submit(reextract_chunk, chunk))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def reextract_documents(chunksize=5000, workers=1, dry_run=False):
+    """Re-extract every stored document; returns (number of documents, {field: rows changed})."""
+    totals = {f: 0 for f in FIELDS}
+    n_docs = 0
+    users = set()
+    if storage.use_sqlite():
+        store = storage.get_store()
+        for chunk, counts, changed_users in _completed_chunks(store.iter_table("documents", chunksize), workers):
+            n_docs += len(chunk)
+            for f, n in counts.items():
+                totals[f] += n
+            if any(counts.values()) and not dry_run:
+                store.update_rows("documents", chunk, FIELDS + ["parsed_json", "parsed_json_blob"])
+            users |= changed_users
+    else:
+        version = file_version(DOCS_CSV)
+        if version is None or version[2] == 0:
+            return n_docs, totals
+        # fixed up front: a chunk only gains parsed_json_blob when one of its rows changed
+        columns = list(pd.read_csv(DOCS_CSV, nrows=0).columns)
+        columns += [c for c in FIELDS + ["parsed_json_blob"] if c not in columns]
+        fd, tmp = tempfile.mkstemp(dir=DOCS_CSV.parent, prefix=f"{DOCS_CSV.name}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", newline="", encoding="utf-8") as out:
+                header = True
+                reader = iter_table_csv(DOCS_CSV, "documents", chunksize)
+                for chunk, counts, changed_users in _completed_chunks(reader, workers):
+                    n_docs += len(chunk)
+                    for f, n in counts.items():
+                        totals[f] += n
+                    users |= changed_users
+                    if not dry_run:
+                        chunk.reindex(columns=columns).to_csv(out, index=False, header=header)
+                        header = False
+            if any(totals.values()) and not dry_run:
+                with table_lock(DOCS_CSV.stem):
+                    # raise rather than drop documents uploaded meanwhile
+                    if file_version(DOCS_CSV) != version:
+                        raise VersionConflict(f"{DOCS_CSV} changed since it was read")
+                    match_file_mode(tmp, DOCS_CSV)
+                    os.replace(tmp, DOCS_CSV)
+        finally:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+
+    if users and not dry_run:
+        import recommendations  # imports bank_matching / streamlit; only needed once rows changed
+        recommendations.rebuild_users(users)
+    return n_docs, totals
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Re-extract fields from stored OCR text without re-running OCR.")
+    parser.add_argument("--chunksize", type=int, default=5000, help="rows per chunk (default 5000)")
+    parser.add_argument("--workers", type=int, default=1, help="process-pool size for chunks (default 1)")
+    parser.add_argument("--dry-run", action="store_true", help="report changes without rewriting documents.csv")
+    args = parser.parse_args(argv)
+
+    t0 = time.perf_counter()
+    n_docs, totals = reextract_documents(args.chunksize, args.workers, args.dry_run)
+    elapsed = time.perf_counter() - t0
+
+    print(f"Re-extracted {n_docs} documents in {elapsed:.2f}s ({n_docs / elapsed if elapsed else 0:.0f} docs/s)")
+    for f in FIELDS:
+        print(f"  {f}: {totals[f]} changed")
+    if args.dry_run:
+        print("Dry run: documents.csv not modified.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,383 @@
+# storage.py
+"""
+Pluggable storage for users, documents, applications, appointments and
+takeovers.
+
+The default "csv" backend is the data/*.csv files (plus the append-only
+journals of journal.py). Setting FINBRIDGE_STORAGE=sqlite switches the same
+tables to a single SQLite database in WAL mode, with indexes on the lookup
+columns (email, app_id, doc_id, ...) so login, register and per-user listings
+are index lookups instead of full-file scans. Each thread gets its own
+connection; statements are parameterised constants, so sqlite3's per-
+connection statement cache keeps them prepared.
+
+Existing CSV data is copied in once with:
+
+    python storage.py [--db data/finbridge.db]
+"""
+import argparse
+import json
+import math
+import os
+import sqlite3
+import sys
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+import pandas as pd
+
+import journal
+from utils import TABLE_SCHEMAS, read_table_csv
+
+DATA_DIR = Path("data")
+BACKENDS = ("csv", "sqlite")
+STORAGE_BACKEND = os.environ.get("FINBRIDGE_STORAGE", "csv").strip().lower()
+SQLITE_PATH = Path(os.environ.get("FINBRIDGE_SQLITE_PATH", DATA_DIR / "finbridge.db"))
+if STORAGE_BACKEND not in BACKENDS:
+    raise ValueError(f"FINBRIDGE_STORAGE must be one of {', '.join(BACKENDS)}, got {STORAGE_BACKEND!r}")
+
+SCHEMAS = {
+    "users": ["id", "email", "password_hash", "full_name", "phone", "created_at", "profile_completed"],
+    "documents": [
+        "doc_id", "email", "upload_time", "source_files",
+        "extracted_name", "extracted_course", "extracted_gpa", "extracted_income", "extracted_admission_year",
+        "raw_text", "parsed_json", "page_sources", "source_hashes",
+        # the remaining extractor fields, so reextract.py can update them in place
+        "extracted_dob", "extracted_college", "extracted_usn", "extracted_loan_amount",
+        # blobstore keys that replace the inline raw_text / parsed_json
+        "raw_text_blob", "parsed_json_blob",
+    ],
+    **journal.TABLES,
+    # latest state per application, maintained by application_state.py
+    "application_state": journal.TABLES["applications"] + ["bank_name", "loan_amount", "tenure_years", "updated_at"],
+}
+INTEGER_COLUMNS = {"id", "doc_id", "app_id", "appointment_id", "bank_id"}
+# (column, unique)
+INDEXES = {
+    "users": [("email", True), ("id", False)],
+    "documents": [("doc_id", False), ("email", False)],
+    "applications": [("app_id", False), ("user_email", False)],
+    "appointments": [("appointment_id", False), ("app_id", False), ("user_email", False)],
+    "takeovers": [("app_id", False), ("user_email", False)],
+    "application_events": [("app_id", False)],
+    "application_state": [("app_id", True), ("user_email", False)],
+}
+# keys outside a table's schema are kept as JSON in this column
+EXTRA = "extra"
+
+
+def use_sqlite():
+    return STORAGE_BACKEND == "sqlite"
+
+
+def _plain(v):
+    """Convert pandas/numpy values to something sqlite3 can bind."""
+    if v is None:
+        return None
+    if hasattr(v, "item") and not isinstance(v, (str, bytes)):
+        v = v.item()
+    if isinstance(v, float) and math.isnan(v):
+        return None
+    if isinstance(v, (dict, list)):
+        return json.dumps(v, ensure_ascii=False)
+    if isinstance(v, (int, float, str, bytes)):
+        return v
+    return str(v)
+
+
+class SqliteStore:
+    """SQLite-backed tables; safe to share across threads (one connection per thread)."""
+
+    def __init__(self, path=SQLITE_PATH):
+        self.path = Path(path)
+        self._local = threading.local()
+        self._sql = {}
+        with self._tx() as conn:
+            self._create_schema(conn)
+
+    # -- connections --------------------------------------------------
+    @property
+    def conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, cached_statements=256)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @contextmanager
+    def _tx(self):
+        conn = self.conn
+        if conn.in_transaction:
+            # nested in transaction(): the outer block commits
+            yield conn
+            return
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def _create_schema(self, conn):
+        for table, cols in SCHEMAS.items():
+            defs = ", ".join(f'"{c}" INTEGER' if c in INTEGER_COLUMNS else f'"{c}"' for c in cols)
+            conn.execute(f'CREATE TABLE IF NOT EXISTS "{table}" ({defs}, "{EXTRA}" TEXT)')
+            # databases created before a column was added to SCHEMAS
+            have = {r["name"] for r in conn.execute(f'PRAGMA table_info("{table}")')}
+            for c in cols:
+                if c not in have:
+                    conn.execute(f'ALTER TABLE "{table}" ADD COLUMN "{c}"{" INTEGER" if c in INTEGER_COLUMNS else ""}')
+            for col, unique in INDEXES.get(table, []):
+                conn.execute(f'CREATE {"UNIQUE " if unique else ""}INDEX IF NOT EXISTS '
+                             f'"ix_{table}_{col}" ON "{table}" ("{col}")')
+
+    # -- row encoding -------------------------------------------------
+    def _insert_sql(self, table, or_ignore=False):
+        key = ("insert", table, or_ignore)
+        if key not in self._sql:
+            cols = SCHEMAS[table] + [EXTRA]
+            names = ", ".join(f'"{c}"' for c in cols)
+            marks = ", ".join("?" for _ in cols)
+            verb = "INSERT OR IGNORE" if or_ignore else "INSERT"
+            self._sql[key] = f'{verb} INTO "{table}" ({names}) VALUES ({marks})'
+        return self._sql[key]
+
+    @staticmethod
+    def _params(table, row):
+        cols = SCHEMAS[table]
+        extra = {k: _plain(v) for k, v in row.items() if k not in cols and k != "_rowid"}
+        extra = {k: v for k, v in extra.items() if v is not None}
+        return [_plain(row.get(c)) for c in cols] + [json.dumps(extra, ensure_ascii=False) if extra else None]
+
+    @staticmethod
+    def _row(rec):
+        row = dict(rec)
+        extra = row.pop(EXTRA, None)
+        if extra:
+            row.update(json.loads(extra))
+        return row
+
+    def _check(self, table, field):
+        if table not in SCHEMAS or field not in SCHEMAS[table]:
+            raise KeyError(f"unknown column {table}.{field}")
+
+    # -- writes -------------------------------------------------------
+    def transaction(self):
+        """Group several writes of this thread into one atomic transaction."""
+        return self._tx()
+
+    def upsert(self, table, key, row):
+        """Insert row, or update the existing row with the same (unique) key column."""
+        self._check(table, key)
+        cols = SCHEMAS[table] + [EXTRA]
+        sql_key = ("upsert", table, key)
+        if sql_key not in self._sql:
+            assign = ", ".join(f'"{c}" = excluded."{c}"' for c in cols if c != key)
+            self._sql[sql_key] = f'{self._insert_sql(table)} ON CONFLICT ("{key}") DO UPDATE SET {assign}'
+        with self._tx() as conn:
+            conn.execute(self._sql[sql_key], self._params(table, row))
+        return row
+
+    def insert(self, table, row):
+        """Insert one row and return it."""
+        with self._tx() as conn:
+            conn.execute(self._insert_sql(table), self._params(table, row))
+        return row
+
+    def insert_many(self, table, rows, ignore_conflicts=False):
+        """Insert rows in one transaction; returns how many were stored."""
+        with self._tx() as conn:
+            before = conn.total_changes
+            conn.executemany(self._insert_sql(table, ignore_conflicts), [self._params(table, r) for r in rows])
+            return conn.total_changes - before
+
+    def update(self, table, field, value, updates):
+        """Set updates on rows where field == value; returns the number of rows changed."""
+        self._check(table, field)
+        cols = [c for c in updates if c in SCHEMAS[table]]
+        extra = {k: v for k, v in updates.items() if k not in SCHEMAS[table]}
+        changed = 0
+        with self._tx() as conn:
+            if cols:
+                assign = ", ".join(f'"{c}" = ?' for c in cols)
+                cur = conn.execute(f'UPDATE "{table}" SET {assign} WHERE "{field}" = ?',
+                                   [_plain(updates[c]) for c in cols] + [_plain(value)])
+                changed = cur.rowcount
+            if extra:
+                recs = conn.execute(f'SELECT rowid, "{EXTRA}" FROM "{table}" WHERE "{field}" = ?',
+                                    (_plain(value),)).fetchall()
+                for rec in recs:
+                    merged = json.loads(rec[EXTRA]) if rec[EXTRA] else {}
+                    merged.update({k: _plain(v) for k, v in extra.items()})
+                    conn.execute(f'UPDATE "{table}" SET "{EXTRA}" = ? WHERE rowid = ?',
+                                 (json.dumps(merged, ensure_ascii=False), rec["rowid"]))
+                changed = len(recs)
+        return changed
+
+    def update_rows(self, table, frame, columns):
+        """Write columns of frame back to the rows named by its _rowid column."""
+        cols = [c for c in columns if c in SCHEMAS[table]]
+        assign = ", ".join(f'"{c}" = ?' for c in cols)
+        sql = f'UPDATE "{table}" SET {assign} WHERE rowid = ?'
+        with self._tx() as conn:
+            conn.executemany(sql, [
+                [_plain(rec[c]) for c in cols] + [int(rec["_rowid"])]
+                for rec in frame.to_dict("records")
+            ])
+
+    # -- reads --------------------------------------------------------
+    def _max(self, conn, table, field):
+        value = conn.execute(f'SELECT MAX("{field}") FROM "{table}"').fetchone()[0]
+        return int(value) if value is not None else 0
+
+    def max_value(self, table, field):
+        self._check(table, field)
+        return self._max(self.conn, table, field)
+
+    def find(self, table, field, value):
+        """All rows where field == value, in insertion order (an index lookup)."""
+        self._check(table, field)
+        recs = self.conn.execute(f'SELECT * FROM "{table}" WHERE "{field}" = ? ORDER BY rowid',
+                                 (_plain(value),)).fetchall()
+        return [self._row(r) for r in recs]
+
+    def values(self, table, field):
+        """Non-null values of one column."""
+        self._check(table, field)
+        return [r[0] for r in self.conn.execute(
+            f'SELECT "{field}" FROM "{table}" WHERE "{field}" IS NOT NULL')]
+
+    def count(self, table):
+        return self.conn.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0]
+
+    def _expand(self, df):
+        if EXTRA in df.columns:
+            extra = df.pop(EXTRA)
+            if extra.notna().any():
+                parsed = pd.DataFrame([json.loads(x) if isinstance(x, str) else {} for x in extra], index=df.index)
+                df = df.join(parsed[[c for c in parsed.columns if c not in df.columns]])
+        return df
+
+    def read_table(self, table, columns=None):
+        """The whole table as a DataFrame (only `columns`, when given)."""
+        if columns is None:
+            df = pd.read_sql_query(f'SELECT * FROM "{table}" ORDER BY rowid', self.conn)
+            return self._expand(df)
+        for c in columns:
+            self._check(table, c)
+        cols = ", ".join(f'"{c}"' for c in columns)
+        return pd.read_sql_query(f'SELECT {cols} FROM "{table}" ORDER BY rowid', self.conn)
+
+    def iter_table(self, table, chunksize):
+        """
+        Yield the table in DataFrame chunks carrying a _rowid column for
+        update_rows(). Each chunk is its own query, so callers may write
+        between chunks.
+        """
+        last = 0
+        while True:
+            df = pd.read_sql_query(f'SELECT rowid AS _rowid, * FROM "{table}" WHERE rowid > ? '
+                                   f'ORDER BY rowid LIMIT ?', self.conn, params=(last, chunksize))
+            if df.empty:
+                return
+            last = int(df["_rowid"].iloc[-1])
+            yield self._expand(df)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """The process-wide SqliteStore for SQLITE_PATH."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = SqliteStore(SQLITE_PATH)
+        return _store
+
+
+# -----------------------------------------------------
+# Journal-backed tables (applications, appointments, takeovers)
+# -----------------------------------------------------
+def append_record(table, row):
+    """Append a row to a journal-backed table on the configured backend; returns it."""
+    if use_sqlite():
+        return get_store().insert(table, row)
+    return journal.append(table, row)
+
+
+def read_records(table):
+    """A journal-backed table as a DataFrame on the configured backend."""
+    if use_sqlite():
+        return get_store().read_table(table)
+    return journal.read_table(table)
+
+
+def user_records(table, user_email):
+    """Rows of one user in a journal-backed table, oldest first (index lookup on either backend)."""
+    if use_sqlite():
+        return get_store().find(table, "user_email", user_email)
+    return journal.read_user_rows(table, user_email)
+
+
+def max_id(table, field):
+    """Largest stored value of a journal-backed table's id column (0 if none); seeds its id sequence."""
+    if use_sqlite():
+        return get_store().max_value(table, field)
+    ids = pd.to_numeric(journal.read_table(table, [field])[field], errors="coerce")
+    return int(ids.max()) if ids.notna().any() else 0
+
+
+# -----------------------------------------------------
+# CSV -> SQLite migration
+# -----------------------------------------------------
+def _csv_rows(table, data_dir):
+    if table in journal.TABLES:
+        df = journal.read_table(table)
+    else:
+        path = Path(data_dir) / f"{table}.csv"
+        if not path.exists() or os.path.getsize(path) == 0:
+            return []
+        df = read_table_csv(path, table) if table in TABLE_SCHEMAS else pd.read_csv(path)
+    # via to_json so NaN becomes None and numpy scalars plain Python
+    return json.loads(df.to_json(orient="records", force_ascii=False))
+
+
+def migrate_csv_to_sqlite(store=None, data_dir=DATA_DIR, log=print):
+    """
+    Copy every data/*.csv table into SQLite. Tables that already hold rows
+    are left alone, so running it twice is harmless. Returns {table: rows copied}.
+    """
+    store = store or get_store()
+    copied = {}
+    for table in SCHEMAS:
+        if store.count(table):
+            log(f"{table}: already has {store.count(table)} rows, skipped")
+            continue
+        rows = _csv_rows(table, data_dir)
+        # users.email is unique; a duplicated legacy email keeps its first row
+        copied[table] = store.insert_many(table, rows, ignore_conflicts=True)
+        dropped = len(rows) - copied[table]
+        log(f"{table}: {copied[table]} rows copied" + (f", {dropped} duplicate(s) dropped" if dropped else ""))
+    return copied
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Copy data/*.csv into the SQLite storage backend.")
+    parser.add_argument("--db", default=str(SQLITE_PATH), help=f"database file (default {SQLITE_PATH})")
+    args = parser.parse_args(argv)
+    migrate_csv_to_sqlite(SqliteStore(args.db))
+    print(f"Done. Set FINBRIDGE_STORAGE=sqlite (and FINBRIDGE_SQLITE_PATH={args.db} if not the default) to use it.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,10 +1,147 @@
 # utils.py
 from pathlib import Path
+from contextlib import contextmanager
 import json
+import os
+import random
+import tempfile
+import threading
+import time
 from datetime import datetime
 
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
 data_dir = Path("data")
 uploads_dir = Path("uploads")
+sequences_dir = data_dir / "sequences"
+locks_dir = data_dir / "locks"
+
+# -------------------------
+# Table schemas
+# -------------------------
+# dtype of every known column, per table. Ids are nullable ints ("Int64") so
+# a missing value no longer turns the whole column into floats (1.0, 2.0...);
+# text is read as str instead of being guessed from its content (phone
+# numbers, USNs). Columns a file has beyond these are still inferred.
+_APPLICATION_COLUMNS = {
+    "app_id": "Int64", "user_email": "str", "bank_id": "Int64", "status": "str",
+    "filled_form_fields_json": "str", "timestamp": "str",
+}
+TABLE_SCHEMAS = {
+    "users": {
+        "id": "Int64", "email": "str", "password_hash": "str", "full_name": "str",
+        "phone": "str", "created_at": "str", "profile_completed": "boolean",
+    },
+    "banks": {
+        "bank_id": "Int64", "bank_name": "str", "min_gpa": "float64", "max_income": "Int64",
+        "min_income": "Int64", "max_loan": "Int64", "base_interest_rate": "float64",
+        "processing_fee_pct": "float64", "notes": "str",
+    },
+    "documents": {
+        "doc_id": "Int64", "user_id": "Int64", "email": "str", "upload_time": "str",
+        "source_files": "str", "file_path": "str", "extracted_text": "str",
+        "extracted_name": "str", "extracted_course": "str", "extracted_gpa": "float64",
+        "extracted_cgpa": "float64", "extracted_income": "float64",
+        "extracted_admission_year": "Int64", "extracted_dob": "str", "extracted_college": "str",
+        "extracted_usn": "str", "extracted_loan_amount": "float64",
+        "raw_text": "str", "parsed_json": "str", "page_sources": "str", "source_hashes": "str",
+        "raw_text_blob": "str", "parsed_json_blob": "str",
+    },
+    "applications": _APPLICATION_COLUMNS,
+    "appointments": {
+        "appointment_id": "Int64", "app_id": "Int64", "user_email": "str", "bank_id": "Int64",
+        "scheduled_time": "str", "created_at": "str", "status": "str",
+    },
+    "takeovers": {
+        "user_email": "str", "app_id": "Int64", "new_bank_id": "str", "new_bank_name": "str",
+        "new_rate": "float64", "remaining_principal": "float64", "requested_at": "str", "status": "str",
+    },
+    "application_events": {"app_id": "Int64", "status": "str", "changed_at": "str", "note": "str"},
+    "application_state": {
+        **_APPLICATION_COLUMNS, "bank_name": "str", "loan_amount": "str",
+        "tenure_years": "str", "updated_at": "str",
+    },
+}
+# low-cardinality, heavily repeated columns held as pandas categoricals once loaded
+CATEGORICAL_COLUMNS = {
+    "applications": {"status", "bank_id"},
+    "appointments": {"status", "bank_id"},
+    "takeovers": {"status"},
+    "application_events": {"status"},
+    "application_state": {"status", "bank_id"},
+}
+
+
+def _coerce(series, dtype):
+    if dtype in ("Int64", "float64"):
+        num = pd.to_numeric(series, errors="coerce")
+        try:
+            return num.astype(dtype)
+        except (TypeError, ValueError):  # a non-integral value in an Int64 column
+            return num
+    if dtype == "boolean":
+        flags = {"true": True, "1": True, "false": False, "0": False}
+        return series.map(lambda v: v if isinstance(v, bool) else flags.get(str(v).strip().lower())).astype("boolean")
+    return series.where(series.isna(), series.astype(str))
+
+
+def apply_schema(df, table):
+    """Cast the known columns of df to the dtypes TABLE_SCHEMAS declares for table; returns df."""
+    schema = TABLE_SCHEMAS[table]
+    categorical = CATEGORICAL_COLUMNS.get(table, ())
+    for col in df.columns:
+        if col in schema:
+            df[col] = _coerce(df[col], schema[col])
+            if col in categorical:
+                df[col] = df[col].astype("category")
+    return df
+
+
+def empty_table(table, columns=None):
+    """An empty frame with the given (default: all known) columns of table, already typed."""
+    schema = TABLE_SCHEMAS[table]
+    columns = list(columns) if columns is not None else list(schema)
+    return apply_schema(pd.DataFrame({c: pd.Series(dtype=object) for c in columns}), table)
+
+
+def _read_dtypes(table):
+    # str/float parse directly; Int64 and boolean are cast afterwards, so a
+    # legacy "1.0" or "False" cannot fail the whole read
+    return {c: (object if t in ("Int64", "boolean") else t) for c, t in TABLE_SCHEMAS[table].items()}
+
+
+def read_table_csv(path, table, columns=None):
+    """
+    Read a table's CSV with explicit dtypes, parsing only `columns` when given
+    (columns the file lacks come back empty). A missing or empty file gives an
+    empty typed frame.
+    """
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return empty_table(table, columns)
+    wanted = None if columns is None else list(columns)
+    try:
+        # shared: waits out an in-progress append instead of reading half a row
+        with table_lock(Path(path).stem, "shared"):
+            df = pd.read_csv(path, dtype=_read_dtypes(table),
+                             usecols=(lambda c: c in wanted) if wanted is not None else None)
+    except pd.errors.EmptyDataError:
+        return empty_table(table, columns)
+    if wanted is not None:
+        df = df.reindex(columns=wanted)
+    return apply_schema(df, table)
+
+
+def iter_table_csv(path, table, chunksize):
+    """read_table_csv() in chunks of chunksize rows (all columns)."""
+    for chunk in pd.read_csv(path, dtype=_read_dtypes(table), chunksize=chunksize):
+        yield apply_schema(chunk, table)
+
 
 def ensure_dirs():
     data_dir.mkdir(exist_ok=True)
@@ -13,16 +150,230 @@ def ensure_dirs():
 def now_iso():
     return datetime.utcnow().isoformat()
 
-def atomic_save_csv(df, path):
+class VersionConflict(RuntimeError):
+    """The file changed between reading it and saving over it."""
+
+
+_UNCHECKED = object()
+
+
+def file_version(path):
+    """
+    Opaque version of path for optimistic writes, or None if it does not
+    exist. Any replace (new inode) or append (size, mtime) changes it.
+    """
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+# read once: os.umask() can only be read by setting it, which races other threads
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def match_file_mode(tmp, target):
+    """
+    chmod a mkstemp() file (always 0600) to target's current mode, or to what
+    open() would give a new target, before it is os.replace()d onto target.
+    """
+    try:
+        mode = os.stat(target).st_mode & 0o7777
+    except FileNotFoundError:
+        mode = 0o666 & ~_UMASK
+    os.chmod(tmp, mode)
+
+
+def atomic_save_csv(df, path, expected_version=_UNCHECKED):
     """
     Save dataframe to CSV atomically by writing to a temp file then replacing.
+
+    The temp file has a unique name and the replace happens under the
+    table's exclusive lock, so concurrent saves never share a temp file.
+    With expected_version (from file_version() when the data was read),
+    VersionConflict is raised instead of overwriting a newer file.
     """
-    tmp = Path(str(path) + ".tmp")
-    df.to_csv(tmp, index=False)
-    tmp.replace(path)
+    path = Path(path)
+    with table_lock(path.stem):
+        if expected_version is not _UNCHECKED and file_version(path) != expected_version:
+            _count_lock_event(path.stem, "conflicts")
+            raise VersionConflict(f"{path} changed since it was read")
+        fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f"{path.name}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", newline="", encoding="utf-8") as f:
+                df.to_csv(f, index=False)
+            match_file_mode(tmp, path)
+            os.replace(tmp, path)
+        except BaseException:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            raise
+
+
+def update_table_csv(path, table, mutate, retries=3):
+    """
+    Read-modify-write of a table CSV. mutate(df) gets the typed table and
+    returns the frame to save (or None to leave the file alone); it may run
+    more than once. The read is optimistic: if another writer saved in
+    between, the file is re-read and mutate run again. After `retries`
+    conflicts the last attempt holds the table's exclusive lock throughout,
+    so a busy table still makes progress. Returns mutate's result.
+    """
+    for _ in range(retries):
+        version = file_version(path)
+        new = mutate(read_table_csv(path, table))
+        if new is None:
+            return None
+        try:
+            atomic_save_csv(new, path, expected_version=version)
+            return new
+        except VersionConflict:
+            time.sleep(random.uniform(0, 0.01))
+    with table_lock(Path(path).stem):
+        new = mutate(read_table_csv(path, table))
+        if new is not None:
+            atomic_save_csv(new, path)
+        return new
 
 def read_json_field(val):
     try:
         return json.loads(val)
     except Exception:
         return None
+
+@contextmanager
+def file_lock(path, blocking=True, shared=False):
+    """
+    OS-level lock on path (created if missing), held across processes;
+    exclusive, or shared with other shared holders (exclusive on Windows).
+    Yields True, or False when blocking=False and it is busy.
+    """
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        try:
+            if fcntl is not None:
+                mode = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+                fcntl.flock(fd, mode | (0 if blocking else fcntl.LOCK_NB))
+            else:
+                msvcrt.locking(fd, msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+        except OSError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            else:
+                os.lseek(fd, 0, os.SEEK_SET)
+                msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+    finally:
+        os.close(fd)
+
+# -------------------------
+# Table locks
+# -------------------------
+# One lock file per table under data/locks/. Writers (saves, appends,
+# read-modify-write) take it exclusive; readers of files that are appended
+# in place take it shared. Each thread tracks what it holds, so nested
+# acquisitions of the same table (e.g. a locked update calling
+# atomic_save_csv) are free instead of deadlocking.
+_held = threading.local()
+_lock_stats = {}
+_lock_stats_lock = threading.Lock()
+
+
+def _table_stats(name):
+    # caller holds _lock_stats_lock
+    return _lock_stats.setdefault(name, {
+        "shared": 0, "exclusive": 0, "busy": 0, "conflicts": 0, "wait_s": 0.0, "max_wait_s": 0.0,
+    })
+
+
+def _count_lock_event(name, event):
+    with _lock_stats_lock:
+        _table_stats(name)[event] += 1
+
+
+@contextmanager
+def table_lock(name, mode="exclusive", blocking=True):
+    """
+    Lock table `name` across threads and processes in "shared" or
+    "exclusive" mode. Yields True, or False when blocking=False and it is
+    busy. A thread already holding the table re-enters without waiting;
+    asking for exclusive while holding shared raises RuntimeError.
+    """
+    if mode not in ("shared", "exclusive"):
+        raise ValueError(f"mode must be 'shared' or 'exclusive', got {mode!r}")
+    held = _held.__dict__.setdefault("modes", {})
+    current = held.get(name)
+    if current is not None:
+        if mode == "exclusive" and current == "shared":
+            raise RuntimeError(f"cannot upgrade the shared lock on {name} to exclusive")
+        yield True
+        return
+    t0 = time.perf_counter()
+    with file_lock(locks_dir / f"{name}.lock", blocking, shared=(mode == "shared")) as acquired:
+        waited = time.perf_counter() - t0
+        with _lock_stats_lock:
+            s = _table_stats(name)
+            if acquired:
+                s[mode] += 1
+                s["wait_s"] += waited
+                s["max_wait_s"] = max(s["max_wait_s"], waited)
+            else:
+                s["busy"] += 1
+        if not acquired:
+            yield False
+            return
+        held[name] = mode
+        try:
+            yield True
+        finally:
+            del held[name]
+
+
+def lock_stats():
+    """Per-table lock acquisitions, wait times, busy (non-blocking misses) and version conflicts."""
+    with _lock_stats_lock:
+        out = {}
+        for name, s in _lock_stats.items():
+            n = (s["shared"] + s["exclusive"]) or 1
+            out[name] = {
+                "shared": s["shared"], "exclusive": s["exclusive"],
+                "busy": s["busy"], "conflicts": s["conflicts"],
+                "avg_wait_ms": round(s["wait_s"] / n * 1000, 3),
+                "max_wait_ms": round(s["max_wait_s"] * 1000, 3),
+            }
+        return out
+
+def allocate_ids(name, count=1, seed=None):
+    """
+    Reserve count consecutive ids from the sequence `name` and return them
+    as a range. The last id handed out is kept in data/sequences/<name>.seq
+    and bumped under a file lock, so concurrent sessions and processes never
+    get the same id and nothing rescans the table. When the counter does not
+    exist yet, seed() (the table's current max id, or 0) starts it.
+    """
+    path = sequences_dir / f"{name}.seq"
+    with file_lock(sequences_dir / f"{name}.lock"):
+        try:
+            last = int(path.read_text().strip())
+        except (FileNotFoundError, ValueError):
+            last = int(seed() or 0) if seed else 0
+        tmp = Path(str(path) + ".tmp")
+        with open(tmp, "w") as f:
+            f.write(str(last + count))
+            f.flush()
+            os.fsync(f.fileno())
+        tmp.replace(path)
+    return range(last + 1, last + count + 1)
+
+def next_id(name, seed=None):
+    """Next id from the sequence `name`; see allocate_ids()."""
+    return allocate_ids(name, 1, seed)[0]